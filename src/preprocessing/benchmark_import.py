@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""
+Measures the cold-start cost of `import msaf`.
+
+Each run imports the module in a fresh interpreter with `-X importtime`, so
+that nothing is cached in memory. The time of an empty interpreter is
+subtracted, and the import time is broken down by top-level package to
+find which dependencies are loaded.
+
+Examples
+--------
+Report the median import time of 5 runs::
+
+    ./benchmark_import.py
+
+Append the result to a metrics file, and fail if it exceeds 1.5 seconds::
+
+    ./benchmark_import.py -o import_times.jsonl --max-seconds 1.5
+"""
+import argparse
+import collections
+import datetime
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+
+# Directory containing the msaf package
+SRC_DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def run_interpreter(statement):
+    """Runs the statement in a fresh interpreter with `-X importtime`.
+
+    Returns
+    -------
+    wall: float
+        Wall time of the interpreter, in seconds.
+    stderr: str
+        Import time report of the interpreter.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [SRC_DIR] + [p for p in [env.get("PYTHONPATH")] if p])
+    start = time.time()
+    proc = subprocess.Popen([sys.executable, "-X", "importtime", "-c",
+                             statement], env=env, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    _, stderr = proc.communicate()
+    wall = time.time() - start
+    stderr = stderr.decode("utf-8", "replace")
+    if proc.returncode != 0:
+        raise RuntimeError("Could not run %r:\n%s" % (statement, stderr))
+    return wall, stderr
+
+
+def self_times_by_package(importtime_report):
+    """Sums the self import times (in seconds) of the modules of each
+    top-level package in an `-X importtime` report."""
+    times = collections.defaultdict(float)
+    for line in importtime_report.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            self_us = int(fields[0])
+        except ValueError:
+            continue  # Header
+        package = fields[2].strip().split(".")[0]
+        times[package] += self_us * 1e-6
+    return times
+
+
+def benchmark(module, repeat):
+    """Times the import of the module `repeat` times.
+
+    Returns
+    -------
+    result: dict
+        Median and minimum import times (without the interpreter startup,
+        in seconds), and median self time of each top-level package.
+    """
+    baseline = min(run_interpreter("pass")[0] for _ in range(repeat))
+    walls = []
+    packages = collections.defaultdict(list)
+    for _ in range(repeat):
+        wall, report = run_interpreter("import %s" % module)
+        walls.append(wall - baseline)
+        for package, t in self_times_by_package(report).items():
+            packages[package].append(t)
+
+    def median(values):
+        values = sorted(values)
+        return values[len(values) // 2]
+
+    return {
+        "module": module,
+        "median_seconds": median(walls),
+        "min_seconds": min(walls),
+        "packages": dict((p, median(t)) for p, t in packages.items())
+    }
+
+
+def main(args):
+    result = benchmark(args.module, args.repeat)
+    result["timestamp"] = datetime.datetime.utcnow().isoformat()
+    result["python"] = platform.python_version()
+    result["repeat"] = args.repeat
+
+    print("import %s: median %.3fs, min %.3fs (%d runs)" %
+          (args.module, result["median_seconds"], result["min_seconds"],
+           args.repeat))
+    heaviest = sorted(result["packages"].items(), key=lambda x: -x[1])
+    for package, t in heaviest[:args.top]:
+        print("    %-24s %.3fs" % (package, t))
+
+    if args.output is not None:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(result, sort_keys=True) + "\n")
+
+    if args.max_seconds is not None and \
+            result["median_seconds"] > args.max_seconds:
+        logging.error("Import time of %s (%.3fs) exceeds %.3fs" %
+                      (args.module, result["median_seconds"],
+                       args.max_seconds))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measures the cold-start import time of msaf.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-m", "--module", default="msaf",
+                        help="Module to import.")
+    parser.add_argument("-n", "--repeat", type=int, default=5,
+                        help="Number of fresh interpreters to time.")
+    parser.add_argument("-t", "--top", type=int, default=10,
+                        help="Number of heaviest packages to report.")
+    parser.add_argument("-o", "--output", default=None,
+                        help="JSON lines file where the result is appended.")
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="Fail if the median import time exceeds it.")
+    logging.basicConfig(format='%(asctime)s: %(levelname)s: %(message)s',
+                        level=logging.INFO)
+    sys.exit(main(parser.parse_args()))
@@ -16,19 +16,32 @@ MSAFRC_WIN_FILE = "~/.msafrc.txt"
 # Get config
 from msaf.configdefaults import config
 
-# Import all submodules
+# Import the core submodules
 from . import features
 from . import input_output as io
-from . import eval
-from . import plotting
 from . import utils
 from . import algorithms
-from . import run
 from .base import features_registry
-from .run import process
 from .input_output import get_all_boundary_algorithms
 from .input_output import get_all_label_algorithms
 
+# The heavier submodules (evaluation, plotting and the runner, with pandas,
+# mir_eval and matplotlib) are imported on first access, e.g.,
+# `msaf.eval` or `msaf.process`
+_lazy_submodules = ["eval", "plotting", "run"]
+_lazy_attributes = {"process": "run"}
+
+
+def __getattr__(name):
+    import importlib
+    if name in _lazy_submodules:
+        return importlib.import_module(__name__ + "." + name)
+    if name in _lazy_attributes:
+        module = importlib.import_module(
+            __name__ + "." + _lazy_attributes[name])
+        return getattr(module, name)
+    raise AttributeError("module %s has no attribute %s" % (__name__, name))
+
 # TODO: Include this in algorithms
 feat_dict = {
     'sf': 'pcp',
@@ -1,12 +1,17 @@
 """
 Initialisation file for all the algorithms contained in MSAF.
+
+Each algorithm is a package in this folder with a `config.py` module that
+declares its metadata (`algo_id`, `is_boundary_type`, `is_label_type`) and
+default parameters. Only these `config.py` modules are imported with
+`msaf.algorithms`, to build the registry of the available algorithms. The
+segmenter code of an algorithm (and its dependencies) is imported the first
+time one of its attributes (e.g., `Segmenter`) is requested.
 """
 import glob
 import importlib
 import os
 
-from . import interface
-
 # Get current path
 curr_path = os.path.dirname(os.path.realpath(__file__))
 files = glob.glob(os.path.join(curr_path, "*"))
@@ -14,21 +19,88 @@ files = glob.glob(os.path.join(curr_path, "*"))
 # Get all modules in the current path, which should be the algorithms
 # available in MSAF
 module_names = []
-for file in files:
+for file in sorted(files):
     if os.path.isdir(file):
         if os.path.isfile(os.path.join(file, "__init__.py")):
             module_names.append(__name__ + "." + os.path.basename(file))
 
-# Import all the algorithms in this folder
-[importlib.import_module(module_name) for module_name in module_names]
-
 # Also init the __all__ var in case they want to use "*" to import all
 __all__ = [module_name.split(".")[-1] for module_name in module_names]
 
+
+def lazy_submodules(package, *submodules):
+    """Returns a module-level `__getattr__` for the given package, which
+    looks up the attributes that are not defined in the package in its
+    `submodules`, importing them on first use.
+
+    Parameters
+    ----------
+    package: str
+        Name of the package (i.e., `__name__`).
+    submodules: str
+        Names of the submodules, in lookup order.
+    """
+    def __getattr__(name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        if name in submodules:
+            return importlib.import_module(package + "." + name)
+        for submodule in submodules:
+            module = importlib.import_module(package + "." + submodule)
+            if hasattr(module, name):
+                return getattr(module, name)
+        raise AttributeError("module %s has no attribute %s" %
+                             (package, name))
+    return __getattr__
+
+
+__getattr__ = lazy_submodules(__name__, "interface")
+
+# Registry of the algorithms, from their identifiers to their (lazy) packages
+registry = {}
+for module_name in module_names:
+    module = importlib.import_module(module_name)
+    registry[module.algo_id] = module
+
+
+def get_algorithm(algo_id):
+    """Obtains the package of an algorithm given its identificator.
+
+    Parameters
+    ----------
+    algo_id: str
+        Algorithm identificator (e.g., foote, sf).
+
+    Returns
+    -------
+    module: object
+        Package of the algorithm, whose `Segmenter` is imported on first
+        access.
+    """
+    try:
+        return registry[algo_id]
+    except KeyError:
+        raise RuntimeError("Algorithm %s can not be found in msaf!" % algo_id)
+
+
+def get_boundary_algorithms():
+    """Returns the identificators of all the boundary algorithms."""
+    return [algo_id for algo_id in sorted(registry)
+            if registry[algo_id].is_boundary_type]
+
+
+def get_label_algorithms():
+    """Returns the identificators of all the label algorithms."""
+    return [algo_id for algo_id in sorted(registry)
+            if registry[algo_id].is_label_type]
+
+
 # Clean up variable space
 del curr_path
 del files
 del module_names
+del module_name
+del module
+del file
 del os
 del glob
-del file
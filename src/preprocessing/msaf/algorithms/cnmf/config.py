@@ -9,6 +9,12 @@ config = {
     "R_labels": 16,
     "rank_labels": 4,
     "niters": 500,
+    "share_factorization": False,  # Reuse the boundaries factorization
+                                   # for the labels
+    "warm_start_rank": False,  # Warm-start each rank increase of the
+                               # boundary search from the previous one
+    "batch_factorizations": False,  # Factorize for the boundaries and
+                                    # the labels at once
     "norm_feats": np.inf  # min_max, log, np.inf,
                           # -np.inf, float >= 0, None
 }
@@ -14,7 +14,7 @@ def median_filter(X, M=8):
     return X
 
 
-def cnmf(S, rank, niter=500, hull=False):
+def cnmf(S, rank, niter=500, hull=False, warm_start=None, gram=None):
     """(Convex) Non-Negative Matrix Factorization.
 
     Parameters
@@ -25,6 +25,13 @@ def cnmf(S, rank, niter=500, hull=False):
         Rank of decomposition
     niter: int
         Number of iterations to be used
+    warm_start: pymf.CNMF
+        Previous C-NMF model of S with a lower rank to initialize the
+        factorization from (see `grow_cnmf`). `None` to initialize it with
+        k-means. Not available for the convex hull NMF.
+    gram: tuple
+        Precomputed `pymf.gram_matrices(S)` to share between several
+        factorizations of S. `None` to compute them.
 
     Returns
     -------
@@ -34,14 +41,96 @@ def cnmf(S, rank, niter=500, hull=False):
         Activation matrix (decomposed matrix)
         (s.t. S ~= F * G)
     """
+    nmf_mdl = cnmf_model(S, rank, niter=niter, hull=hull,
+                         warm_start=warm_start, gram=gram)
+    F = np.asarray(nmf_mdl.W)
+    G = np.asarray(nmf_mdl.H)
+    return F, G
+
+
+def cnmf_batch(Ss, ranks, niter=500):
+    """C-NMF of several feature matrices at once.
+
+    The factorizations are run as one batched problem (see `pymf.BatchCNMF`),
+    with the same updates and stopping as `cnmf` for each of them.
+
+    Parameters
+    ----------
+    Ss: list of np.array(p, N_i)
+        Features matrices.
+    ranks: list of int
+        Rank of decomposition of each features matrix.
+    niter: int
+        Number of iterations to be used
+
+    Returns
+    -------
+    FGs: list
+        List of the (F, G) matrices of each features matrix, as in `cnmf`.
+    """
+    nmf_mdl = pymf.BatchCNMF(Ss, num_bases=ranks)
+    nmf_mdl.factorize(niter=niter)
+    return [(np.asarray(F), np.asarray(G))
+            for F, G in zip(nmf_mdl.W, nmf_mdl.H)]
+
+
+def cnmf_model(S, rank, niter=500, hull=False, warm_start=None, gram=None):
+    """Same as `cnmf`, but returns the factorized pymf model."""
     if hull:
         nmf_mdl = pymf.CHNMF(S, num_bases=rank)
+    elif warm_start is not None:
+        nmf_mdl = grow_cnmf(S, warm_start, rank)
     else:
-        nmf_mdl = pymf.CNMF(S, num_bases=rank)
+        nmf_mdl = pymf.CNMF(S, num_bases=rank, gram=gram)
     nmf_mdl.factorize(niter=niter)
-    F = np.asarray(nmf_mdl.W)
-    G = np.asarray(nmf_mdl.H)
-    return F, G
+    return nmf_mdl
+
+
+def grow_cnmf(S, nmf_mdl, rank):
+    """Creates a C-NMF model of S of the given rank, initialized from a
+    factorization of S with a lower rank.
+
+    The previous bases are kept, and each new basis is seeded from the frames
+    that are worst reconstructed by the previous factorization, so that no
+    k-means initialization is needed.
+
+    Parameters
+    ----------
+    S: np.array(p, N)
+        Features matrix. p row features and N column observations.
+    nmf_mdl: pymf.CNMF
+        Factorized C-NMF model of S.
+    rank: int
+        Rank of the new decomposition (larger than the one of `nmf_mdl`).
+
+    Returns
+    -------
+    new_mdl: pymf.CNMF
+        The (not yet factorized) warm-started C-NMF model.
+    """
+    G = np.asarray(nmf_mdl.G)
+    H = np.asarray(nmf_mdl.H)
+    n_new = rank - G.shape[1]
+    n_samples = S.shape[1]
+
+    # Assign the worst reconstructed frames to the new bases, with the same
+    # offsets used by the k-means initialization of pymf.CNMF
+    err = np.sum((S - np.dot(np.asarray(nmf_mdl.W), H)) ** 2, axis=0)
+    worst = np.argsort(err)[::-1]
+    n_seed = max(1, n_samples // rank)
+    G_new = np.full((n_samples, n_new), 0.01)
+    H_new = np.full((n_new, n_samples), 0.2)
+    for i in range(n_new):
+        idxs = worst[i * n_seed:(i + 1) * n_seed]
+        G_new[idxs, i] += 1.0
+        H_new[i, idxs] += 1.0
+    G_new /= n_seed
+
+    new_mdl = pymf.CNMF(S, num_bases=rank, gram=nmf_mdl.gram)
+    new_mdl.G = np.hstack((G, G_new))
+    new_mdl.H = np.vstack((H, H_new))
+    new_mdl.W = np.dot(S, new_mdl.G)
+    return new_mdl
 
 
 def most_frequent(x):
@@ -49,11 +138,28 @@ def most_frequent(x):
     return np.argmax(np.bincount(x))
 
 
-def compute_labels(X, rank, R, bound_idxs, niter=300):
-    """Computes the labels using the bounds."""
+def compute_labels(X, rank, R, bound_idxs, niter=300, nmf_mdl=None,
+                   gram=None, G=None):
+    """Computes the labels using the bounds.
 
+    If `nmf_mdl` (the factorization of X used to find the boundaries) is
+    given, it is reused when it has the same rank, or used to warm-start
+    the factorization when its rank is lower. Otherwise, X is factorized
+    from a k-means initialization, sharing the precomputed `gram` matrices
+    if given, unless its activation matrix `G` of the given rank was
+    already computed.
+    """
     try:
-        F, G = cnmf(X, rank, niter=niter, hull=False)
+        if G is not None:
+            G = np.array(G)
+        elif nmf_mdl is not None and nmf_mdl._num_bases == rank:
+            G = np.array(nmf_mdl.H)
+        else:
+            if nmf_mdl is not None and nmf_mdl._num_bases > rank:
+                gram = nmf_mdl.gram
+                nmf_mdl = None
+            F, G = cnmf(X, rank, niter=niter, hull=False, warm_start=nmf_mdl,
+                        gram=gram)
     except:
         return [1]
 
@@ -96,7 +202,9 @@ def filter_activation_matrix(G, R):
 
 
 def get_segmentation(X, rank, R, rank_labels, R_labels, niter=300,
-                     bound_idxs=None, in_labels=None):
+                     bound_idxs=None, in_labels=None,
+                     share_factorization=False, warm_start_rank=False,
+                     batch_factorizations=False):
     """
     Gets the segmentation (boundaries and labels) from the factorization
     matrices.
@@ -115,6 +223,19 @@ def get_segmentation(X, rank, R, rank_labels, R_labels, niter=300,
         Use previously found boundaries (None to detect them)
     in_labels : np.array()
         List of input labels (None to compute them)
+    share_factorization : bool
+        Whether the labels reuse the Gram matrices and the factorization
+        computed for the boundaries, instead of factorizing X again.
+    warm_start_rank : bool
+        Whether each rank increase of the boundary search is initialized
+        from the previous factorization (see `grow_cnmf`), instead of
+        k-means. Faster, but the boundaries differ from the cold start.
+    batch_factorizations : bool
+        Whether the factorizations for the boundaries and for the labels are
+        run at once (see `cnmf_batch`). Each factorization is the same as
+        on its own, but the labels one is initialized right after the
+        boundaries one, so the results differ when the rank has to grow.
+        Only used when both are computed without sharing the factorization.
 
     Returns
     -------
@@ -130,15 +251,40 @@ def get_segmentation(X, rank, R, rank_labels, R_labels, niter=300,
 
     # Find non filtered boundaries
     compute_bounds = True if bound_idxs is None else False
+    gram = pymf.gram_matrices(X) if share_factorization else None
+    nmf_mdl = None
+
+    # Factorize for the boundaries and for the labels at once
+    bounds_G, labels_G = None, None
+    if batch_factorizations and compute_bounds and in_labels is None and \
+            not share_factorization and not warm_start_rank and \
+            max(rank, rank_labels) <= X.shape[1]:
+        try:
+            (_, bounds_G), (_, labels_G) = cnmf_batch(
+                [X, X], [rank, rank_labels], niter=niter)
+        except:
+            # Factorize them one by one (as the errors are handled there)
+            bounds_G, labels_G = None, None
+
     while True:
         if bound_idxs is None:
-            try:
-                F, G = cnmf(X, rank, niter=niter, hull=False)
-            except:
+            # There can't be more bases than frames
+            if rank > X.shape[1]:
                 return np.empty(0), [1]
-
-            # Filter G
-            G = filter_activation_matrix(G.T, R)
+            if bounds_G is not None:
+                H, bounds_G = bounds_G, None
+            else:
+                try:
+                    nmf_mdl = cnmf_model(
+                        X, rank, niter=niter, hull=False,
+                        warm_start=nmf_mdl if warm_start_rank else None,
+                        gram=gram)
+                except:
+                    return np.empty(0), [1]
+                H = nmf_mdl.H
+
+            # Filter G (on a copy, the model is reused if the rank grows)
+            G = filter_activation_matrix(np.array(H).T, R)
             if bound_idxs is None:
                 bound_idxs = np.where(np.diff(G) != 0)[0] + 1
 
@@ -153,8 +299,10 @@ def get_segmentation(X, rank, R, rank_labels, R_labels, niter=300,
     bound_idxs = np.concatenate(([0], bound_idxs, [X.shape[1] - 1]))
     bound_idxs = np.asarray(bound_idxs, dtype=int)
     if in_labels is None:
-        labels = compute_labels(X, rank_labels, R_labels, bound_idxs,
-                                niter=niter)
+        labels = compute_labels(
+            X, rank_labels, R_labels, bound_idxs, niter=niter,
+            nmf_mdl=nmf_mdl if share_factorization else None, gram=gram,
+            G=labels_G)
     else:
         labels = np.ones(len(bound_idxs) - 1)
 
@@ -208,7 +356,10 @@ class Segmenter(SegmenterInterface):
             est_idxs, est_labels = get_segmentation(
                 F.T, self.config["rank"], self.config["R"],
                 self.config["rank_labels"], self.config["R_labels"],
-                niter=niter, bound_idxs=self.in_bound_idxs, in_labels=None)
+                niter=niter, bound_idxs=self.in_bound_idxs, in_labels=None,
+                share_factorization=self.config["share_factorization"],
+                warm_start_rank=self.config["warm_start_rank"],
+                batch_factorizations=self.config["batch_factorizations"])
 
             # Remove empty segments if needed
             est_idxs, est_labels = U.remove_empty_segments(est_idxs, est_labels)
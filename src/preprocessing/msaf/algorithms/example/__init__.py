@@ -1,2 +1,4 @@
 from .config import *
-from .segmenter import *
+from msaf.algorithms import lazy_submodules
+
+__getattr__ = lazy_submodules(__name__, "segmenter")
@@ -6,8 +6,11 @@ import numpy as np
 config = {
     "dirichlet": False,
     "xmeans": False,
+    "xmeans_reuse_sweep": False,  # Take the labels from the xmeans sweep
+                                  # instead of clustering again
     "k": 4,
     "2dfmc_offset": 4,  # Number of frames to ignore in the beginning and end of each segment
+    "2dfmc_batch_size": None,  # Max number of segments transformed at once (None for all)
     "label_norm_feats": np.inf,  # "min_max", "log", np.inf,
                                  # -np.inf, float >= 0, None
     "label_norm_floor": 0.1,
@@ -46,16 +46,23 @@ def get_feat_segments(F, bound_idxs):
     return feat_segments
 
 
-def feat_segments_to_2dfmc_max(feat_segments, offset=4):
+def feat_segments_to_2dfmc_max(feat_segments, offset=4, batch_size=None):
     """From a list of feature segments, return a list of 2D-Fourier Magnitude
     Coefs using the maximum segment size as main size and zero pad the rest.
 
+    The segments are zero padded into a stacked tensor and transformed with
+    a single real 2D-FFT.
+
     Parameters
     ----------
     feat_segments: list
         List of segments, one for each boundary interval.
     offset: int >= 0
         Number of frames to ignore from beginning and end of each segment.
+    batch_size: int > 0
+        Maximum number of segments padded and transformed at once (`None`
+        for all of them). Bounds the memory of the padded tensor when a few
+        segments are much longer than the rest.
 
     Returns
     -------
@@ -67,39 +74,49 @@ def feat_segments_to_2dfmc_max(feat_segments, offset=4):
 
     # Get maximum segment size
     max_len = max([feat_segment.shape[0] for feat_segment in feat_segments])
-
-    fmcs = []
-    for feat_segment in feat_segments:
-        # Zero pad if needed
-        X = np.zeros((max_len, feat_segment.shape[1]))
-
-        # Remove a set of frames in the beginning an end of the segment
-        if feat_segment.shape[0] <= offset or offset == 0:
-            X[:feat_segment.shape[0], :] = feat_segment
-        else:
-            X[:feat_segment.shape[0] - offset, :] = \
-                feat_segment[offset // 2:-offset // 2, :]
-
-        # Compute the 2D-FMC
+    n_feats = feat_segments[0].shape[1]
+    n_segments = len(feat_segments)
+    if batch_size is None:
+        batch_size = n_segments
+
+    fmcs = np.empty((n_segments, (max_len * n_feats) // 2 + 1))
+    X = np.empty((min(batch_size, n_segments), max_len, n_feats))
+    for start in range(0, n_segments, batch_size):
+        stop = min(start + batch_size, n_segments)
+        X_batch = X[:stop - start]
+
+        # Zero pad
+        X_batch.fill(0)
+        for X_seg, feat_segment in zip(X_batch, feat_segments[start:stop]):
+            # Remove a set of frames in the beginning an end of the segment
+            if feat_segment.shape[0] <= offset or offset == 0:
+                X_seg[:feat_segment.shape[0], :] = feat_segment
+            else:
+                X_seg[:feat_segment.shape[0] - offset, :] = \
+                    feat_segment[offset // 2:-offset // 2, :]
+
+        # Compute the 2D-FMCs
         try:
-            fmcs.append(utils2d.compute_ffmc2d(X))
+            utils2d.compute_ffmc2d_batch(X_batch, out=fmcs[start:stop])
         except:
             logging.warning("Couldn't compute the 2D Fourier Transform")
-            fmcs.append(np.zeros((X.shape[0] * X.shape[1]) // 2 + 1))
-
-        # Normalize
-        # fmcs[-1] = fmcs[-1] / float(fmcs[-1].max())
+            fmcs[start:stop] = 0
 
-    return np.asarray(fmcs)
+    return fmcs
 
 
-def compute_labels_kmeans(fmcs, k):
+def preprocess_fmcs(fmcs):
+    """Pre-processes the 2D-FMCs for clustering."""
     # Removing the higher frequencies seem to yield better results
     fmcs = fmcs[:, fmcs.shape[1] // 2:]
 
     # Pre-process
     fmcs = np.log1p(fmcs)
-    wfmcs = vq.whiten(fmcs)
+    return vq.whiten(fmcs)
+
+
+def compute_labels_kmeans(fmcs, k):
+    wfmcs = preprocess_fmcs(fmcs)
 
     # Make sure we are not using more clusters than existing segments
     if k > fmcs.shape[0]:
@@ -112,8 +129,19 @@ def compute_labels_kmeans(fmcs, k):
     return kmeans.labels_
 
 
+def compute_labels_xmeans(fmcs, th=0.01, maxK=8):
+    """Estimates the number of labels with a single K-means sweep and BIC
+    (see `XMeans.estimate_K_knee`) on the pre-processed 2D-FMCs, and returns
+    the labels of the chosen K-means model of the sweep, instead of
+    clustering again with `compute_labels_kmeans`. Faster, but the labels
+    differ from the original method."""
+    xm = XMeans(preprocess_fmcs(fmcs), plot=False)
+    k = xm.estimate_K_knee(th=th, maxK=maxK)
+    return xm.get_labels(k)
+
+
 def compute_similarity(F, bound_idxs, dirichlet=False, xmeans=False, k=5,
-                       offset=4):
+                       offset=4, batch_size=None, reuse_xmeans_sweep=False):
     """Main function to compute the segment similarity of file file_struct.
 
     Parameters
@@ -130,6 +158,11 @@ def compute_similarity(F, bound_idxs, dirichlet=False, xmeans=False, k=5,
         If the other two predictors are `False`, use fixed number of labels.
     offset: int >= 0
         Number of frames to ignore from beginning and end of each segment.
+    batch_size: int > 0
+        Maximum number of segments transformed at once (`None` for all).
+    reuse_xmeans_sweep: boolean
+        Whether the xmeans estimator returns the labels of its K-means sweep
+        (see `compute_labels_xmeans`) instead of clustering again.
 
     Returns
     -------
@@ -140,7 +173,7 @@ def compute_similarity(F, bound_idxs, dirichlet=False, xmeans=False, k=5,
     feat_segments = get_feat_segments(F, bound_idxs)
 
     # Get the 2D-FMCs segments
-    fmcs = feat_segments_to_2dfmc_max(feat_segments, offset)
+    fmcs = feat_segments_to_2dfmc_max(feat_segments, offset, batch_size)
     if len(fmcs) == 0:
         return np.arange(len(bound_idxs) - 1)
 
@@ -157,11 +190,14 @@ def compute_similarity(F, bound_idxs, dirichlet=False, xmeans=False, k=5,
             k = len(dpgmm.means_)
             labels_est = dpgmm.predict(fmcs)
             # print("Estimated with Dirichlet Process:", k)
-    if xmeans:
-        xm = XMeans(fmcs, plot=False)
-        k = xm.estimate_K_knee(th=0.01, maxK=8)
-        labels_est = compute_labels_kmeans(fmcs, k=k)
-        # print("Estimated with Xmeans:", k)
+    elif xmeans:
+        if reuse_xmeans_sweep:
+            labels_est = compute_labels_xmeans(fmcs, th=0.01, maxK=8)
+        else:
+            xm = XMeans(fmcs, plot=False)
+            k = xm.estimate_K_knee(th=0.01, maxK=8)
+            labels_est = compute_labels_kmeans(fmcs, k=k)
+            # print("Estimated with Xmeans:", k)
     else:
         labels_est = compute_labels_kmeans(fmcs, k=k)
 
@@ -200,7 +236,9 @@ class Segmenter(SegmenterInterface):
                                         dirichlet=self.config["dirichlet"],
                                         xmeans=self.config["xmeans"],
                                         k=self.config["k"],
-                                        offset=self.config["2dfmc_offset"])
+                                        offset=self.config["2dfmc_offset"],
+                                        batch_size=self.config["2dfmc_batch_size"],
+                                        reuse_xmeans_sweep=self.config["xmeans_reuse_sweep"])
 
         # Post process estimations
         self.in_bound_idxs, est_labels = self._postprocess(self.in_bound_idxs,
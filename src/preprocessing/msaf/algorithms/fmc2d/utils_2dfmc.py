@@ -6,7 +6,6 @@ import copy
 import numpy as np
 import json
 import scipy.fftpack
-import pylab as plt
 
 def resample_mx(X, incolpos, outcolpos):
     """
@@ -128,3 +127,50 @@ def compute_ffmc2d(X):
 
     # Take out redundant components
     return fftshift[:fftshift.shape[0] // 2 + 1]
+
+
+def ffmc2d_index(n_frames, n_feats):
+    """Indeces of the 2D-FMC coefficients (see `compute_ffmc2d`) into the
+    flattened magnitudes of the real 2D-FFT of a `(n_frames, n_feats)`
+    matrix, with the real transform taken along the frames.
+
+    The FMC keeps the first half of the flattened, fftshifted magnitudes,
+    i.e., the non-positive frequencies along the frames. By the symmetry of
+    the transform of a real matrix, |X(-k, -l)| = |X(k, l)|, so they are all
+    found among the non-negative frequencies computed by the real FFT.
+    """
+    n_coefs = (n_frames * n_feats) // 2 + 1
+    p = np.arange(n_coefs)
+    k = n_frames // 2 - p // n_feats
+    l = (n_feats // 2 - p % n_feats) % n_feats
+    return k * n_feats + l
+
+
+def compute_ffmc2d_batch(X, out=None):
+    """Computes the 2D-Fourier Magnitude Coefficients of a stack of matrices
+    of the same shape at once, with a single real 2D-FFT.
+
+    Parameters
+    ----------
+    X: np.ndarray
+        Tensor of shape `(n_matrices, n_frames, n_feats)`.
+    out: np.ndarray
+        Optional output of shape `(n_matrices, (n_frames * n_feats) // 2 + 1)`.
+
+    Returns
+    -------
+    fmcs: np.ndarray
+        The same coefficients as `compute_ffmc2d` for each matrix.
+    """
+    n, n_frames, n_feats = X.shape
+    fft2 = np.fft.rfftn(X, axes=(2, 1))
+
+    # Magnitude (written over the real part)
+    fft2m = fft2.real
+    np.hypot(fft2m, fft2.imag, out=fft2m)
+
+    # FFTshift, flatten and take out redundant components in a single gather
+    idx = ffmc2d_index(n_frames, n_feats)
+    if out is None:
+        out = np.empty((n, len(idx)))
+    return np.take(fft2m.reshape(n, -1), idx, axis=1, out=out)
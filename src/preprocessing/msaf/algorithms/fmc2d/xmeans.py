@@ -4,9 +4,7 @@
 import argparse
 import numpy as np
 import time
-import pylab as plt
 import scipy.cluster.vq as vq
-from scipy.spatial import distance
 
 
 class XMeans:
@@ -14,12 +12,27 @@ class XMeans:
         self.X = X
         self.init_K = init_K
         self.plot = plot
+        self.models = {}
+        self._wX = None
+
+    def whitened(self):
+        """Returns the whitened data (computed once)."""
+        if self._wX is None:
+            self._wX = vq.whiten(self.X)
+        return self._wX
+
+    def get_labels(self, K):
+        """Returns the labels of the K-means model with K clusters, reusing
+        the model fitted by `sweep_kmeans` if there is one."""
+        if K not in self.models:
+            self.models[K] = self.run_kmeans(self.whitened(), K)
+        return self.models[K][1]
 
     def estimate_K_xmeans(self, th=0.2, maxK = 10):
         """Estimates K running X-means algorithm (Pelleg & Moore, 2000)."""
 
         # Run initial K-means
-        means, labels = self.run_kmeans(self.X, self.init_K)
+        means, labels = self.run_kmeans(self.whitened(), self.init_K)
 
         # Run X-means algorithm
         stop = False
@@ -70,6 +83,7 @@ class XMeans:
 
             #print "Estimated K: ", curr_K
             if self.plot:
+                import matplotlib.pyplot as plt
                 plt.scatter(self.X[:, 0], self.X[:, 1])
                 plt.scatter(final_means[:, 0], final_means[:, 1], color="y")
                 plt.show()
@@ -81,6 +95,21 @@ class XMeans:
 
         return curr_K
 
+    def sweep_kmeans(self, maxK):
+        """Runs K-means once for each K in [1, maxK), keeping the fitted
+        models in `self.models` (K -> (means, labels)), and returns the
+        BIC of each of them."""
+        wX = self.whitened()
+        K = np.arange(1, maxK)
+        bics = []
+        for k in K:
+            if k not in self.models:
+                self.models[k] = self.run_kmeans(wX, k)
+            means, labels = self.models[k]
+            bics.append(self.compute_bic(wX, means, labels, K=k,
+                                         R=wX.shape[0], whitened=True))
+        return K, bics
+
     def estimate_K_knee(self, th=.015, maxK=12):
         """Estimates the K using K-means and BIC, by sweeping various K and
             choosing the optimal BIC."""
@@ -89,13 +118,7 @@ class XMeans:
             maxK = self.X.shape[0]
         if maxK < 2:
             maxK = 2
-        K = np.arange(1, maxK)
-        bics = []
-        for k in K:
-            means, labels = self.run_kmeans(self.X, k)
-            bic = self.compute_bic(self.X, means, labels, K=k,
-                                   R=self.X.shape[0])
-            bics.append(bic)
+        K, bics = self.sweep_kmeans(maxK)
         diff_bics = np.diff(bics)
         finalK = K[-1]
 
@@ -120,6 +143,7 @@ class XMeans:
 
         #print "Estimated K: ", finalK
         if self.plot:
+            import matplotlib.pyplot as plt
             plt.subplot(2, 1, 1)
             plt.plot(K, bics, label="BIC")
             plt.plot(K[:-1], diff_bics, label="BIC diff")
@@ -137,29 +161,27 @@ class XMeans:
         return D.reshape((D.shape[0], D.shape[-1]))
 
     def run_kmeans(self, X, K):
-        """Runs k-means and returns the labels assigned to the data."""
-        wX = vq.whiten(X)
-        means, dist = vq.kmeans(wX, K, iter=100)
-        labels, dist = vq.vq(wX, means)
+        """Runs k-means on the (already whitened) data and returns the means
+        and the labels assigned to the data."""
+        means, dist = vq.kmeans(X, K, iter=100)
+        labels, dist = vq.vq(X, means)
         return means, labels
 
-    def compute_bic(self, D, means, labels, K, R):
+    def compute_bic(self, D, means, labels, K, R, whitened=False):
         """Computes the Bayesian Information Criterion."""
-        D = vq.whiten(D)
+        if not whitened:
+            D = vq.whiten(D)
         Rn = D.shape[0]
         M = D.shape[1]
 
         if R == K:
             return 1
 
-        # Maximum likelihood estimate (MLE)
-        mle_var = 0
-        for k in range(len(means)):
-            X = D[np.argwhere(labels == k)]
-            X = X.reshape((X.shape[0], X.shape[-1]))
-            for x in X:
-                mle_var += distance.euclidean(x, means[k])
-                #print x, means[k], mle_var
+        # Maximum likelihood estimate (MLE), from the distances of all the
+        # points to their means at once
+        means = np.asarray(means)
+        labels = np.asarray(labels, dtype=int)
+        mle_var = np.sqrt(((D - means[labels]) ** 2).sum(axis=1)).sum()
         mle_var /= float(R - K)
 
         # Log-likelihood of the data
@@ -201,6 +223,7 @@ def test_kmeans(K=5):
     wX = vq.whiten(X)
     dic, dist = vq.kmeans(wX, K, iter=100)
 
+    import matplotlib.pyplot as plt
     plt.scatter(wX[:, 0], wX[:, 1])
     plt.scatter(dic[:, 0], dic[:, 1], color="m")
     plt.show()
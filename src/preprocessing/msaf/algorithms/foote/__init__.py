@@ -7,4 +7,6 @@ Checkerboard Kernel
     Segmenter
 """
 from .config import *
-from .segmenter import *
+from msaf.algorithms import lazy_submodules
+
+__getattr__ = lazy_submodules(__name__, "segmenter")
@@ -6,7 +6,6 @@ import numpy as np
 from scipy.spatial import distance
 from scipy import signal
 from scipy.ndimage import filters
-import pylab as plt
 
 import msaf
 from msaf.algorithms.interface import SegmenterInterface
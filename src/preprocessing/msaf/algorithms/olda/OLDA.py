@@ -2,7 +2,6 @@
 #
 # Ordinal LDA
 
-import itertools
 import numpy as np
 import scipy.linalg
 from sklearn.base import BaseEstimator, TransformerMixin
@@ -66,7 +65,7 @@ class OLDA(BaseEstimator, TransformerMixin):
         self : object
         '''
         
-        for (xi, yi) in itertools.izip(X, Y):
+        for (xi, yi) in zip(X, Y):
             
             prev_mean       = None
             prev_length     = None
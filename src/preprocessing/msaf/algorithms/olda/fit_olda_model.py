@@ -6,10 +6,12 @@ import numpy as np
 
 import mir_eval
 import jams
-import cPickle as pickle
+import os
+import pickle
 
 import OLDA
 import segmenter
+from train_data import TrainingSet
 
 import msaf
 
@@ -18,13 +20,9 @@ def process_arguments():
     parser = argparse.ArgumentParser(
         description='OLDA fit for music segmentation')
 
-    parser.add_argument("ds_path",
-                        action="store",
-                        help="Input dataset")
-
     parser.add_argument('input_file',
                         action='store',
-                        help='path to training data (from make_*_train.py)')
+                        help='path to training data (from make_train.py)')
 
     parser.add_argument('output_file',
                         action='store',
@@ -47,17 +45,25 @@ def process_arguments():
 
 
 def load_data(input_file):
+    """Loads the training data.
 
-    with open(input_file, 'r') as f:
+    `input_file` is either a training set directory in the columnar format
+    (see `train_data`), whose columns are memory-mapped, or a legacy pickle
+    file.
+    """
+    if os.path.isdir(input_file):
         #   X = features
         #   Y = segment boundaries (as beat numbers)
         #   B = beat timings
         #   T = true segment boundaries (seconds)
         #   F = filename
+        data = TrainingSet(input_file)
+        return data.X, data.Y, data.B, data.T, data.F
 
-        X, Y, B, T = pickle.load(f)[:4]
+    with open(input_file, 'rb') as f:
+        X, Y, B, T, F = pickle.load(f)[:5]
 
-    return X, Y, B, T
+    return X, Y, B, T, F
 
 
 def score_model(model, x, b, t):
@@ -65,7 +71,7 @@ def score_model(model, x, b, t):
     # First, transform the data
     if model is not None:
         try:
-            xt = model.dot(x)
+            xt = segmenter.project_features(model, x)
         except:
             return 0.0
     else:
@@ -90,7 +96,7 @@ def score_model(model, x, b, t):
     return score
 
 
-def fit_model(X, Y, B, T, n_jobs, annot_beats, ds_path):
+def fit_model(X, Y, B, T, F, n_jobs, annot_beats):
 
     SIGMA = 10 ** np.arange(-2, 18)
 
@@ -103,16 +109,14 @@ def fit_model(X, Y, B, T, n_jobs, annot_beats, ds_path):
         O.fit(X, Y)
 
         scores = []
-        files = msaf.io.get_dataset_files(ds_path)
-        for f, z in zip(files, zip(X, B, T)):
-            f = f.ref_file
-            beats = z[1]
+        for f, x, beats, t in zip(F, X, B, T):
+            f = msaf.io.FileStruct(f).ref_file
             if annot_beats:
                 jam = jams.load(f)
                 ann = jam.search(namespace="beat")[0]
                 beats = ann.data.to_interval_values()[0][:, 0]
             print("\t\tProcessing ", f)
-            scores.append(score_model(O.components_, z[0], beats, z[2]))
+            scores.append(score_model(O.components_, x, beats, t))
 
         mean_score = np.mean(scores)
         print('Sigma=%.2e, score=%.3f' % (sig, mean_score))
@@ -129,10 +133,10 @@ if __name__ == '__main__':
     parameters = process_arguments()
 
     print("Loading data from %s ..." % parameters["input_file"])
-    X, Y, B, T = load_data(parameters['input_file'])[:4]
+    X, Y, B, T, F = load_data(parameters['input_file'])
 
     print("Fitting model...")
-    model = fit_model(X, Y, B, T, parameters['num_jobs'],
-                      parameters['annot_beats'], parameters['ds_path'])
+    model = fit_model(X, Y, B, T, F, parameters['num_jobs'],
+                      parameters['annot_beats'])
 
     np.save(parameters['output_file'], model)
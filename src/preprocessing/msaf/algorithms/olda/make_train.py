@@ -7,12 +7,12 @@ import os
 import time
 
 from joblib import Parallel, delayed
-import cPickle as pickle
 
 import msaf
 from msaf.base import Features
 
 from segmenter import features
+from train_data import TrainingSetWriter
 
 
 def align_segmentation(beat_times, song):
@@ -43,7 +43,7 @@ def align_segmentation(beat_times, song):
     segment_intervals = msaf.utils.times_to_intervals(segment_times)
 
     # Map beats to intervals
-    beat_intervals = np.asarray(zip(beat_times[:-1], beat_times[1:]))
+    beat_intervals = np.asarray(list(zip(beat_times[:-1], beat_times[1:])))
 
     # Map beats to segments
     beat_segment_ids = librosa.util.match_intervals(beat_intervals,
@@ -80,16 +80,19 @@ def get_annotation(song, rootpath):
 
 
 def import_data(file_struct, rootpath, output_path, annot_beats):
+    """Computes (or reads from the cache) the training data of a track.
+
+    Returns the path to the cached `.npz` file of the track, or `None` if
+    the track can not be used for training.
+    """
     msaf.utils.ensure_dir(output_path)
     msaf.utils.ensure_dir(os.path.join(output_path, "features"))
-    data_file = '%s/features/%s_annotbeatsE%d.pickle' % \
+    data_file = '%s/features/%s_annotbeatsE%d.npz' % \
         (output_path, os.path.splitext(
             os.path.basename(file_struct.audio_file))[0], annot_beats)
 
     if os.path.exists(data_file):
-        with open(data_file, 'r') as f:
-            Data = pickle.load(f)
-            print(file_struct.audio_file, 'cached!')
+        print(file_struct.audio_file, 'cached!')
     else:
         X, _ = features(file_struct, annot_beats)
         pcp_obj = Features.select_features("pcp", file_struct, annot_beats,
@@ -99,51 +102,48 @@ def import_data(file_struct, rootpath, output_path, annot_beats):
         if X is None:
             return X
 
-        Y, T, L = align_segmentation(
-            get_annotation(file_struct.audio_file, rootpath), B,
-            file_struct.audio_file)
+        Y, T, L = align_segmentation(B, file_struct.audio_file)
 
         if Y is None:
             return Y
 
-        Data = {'features': X,
-                'beats': B,
-                'filename': file_struct.audio_file,
-                'segment_times': T,
-                'segment_labels': L,
-                'segments': Y}
+        np.savez(data_file,
+                 features=X,
+                 beats=B,
+                 filename=file_struct.audio_file,
+                 segment_times=T,
+                 segment_labels=np.asarray(L, dtype=str),
+                 segments=np.asarray(Y, dtype=int))
         print(file_struct.audio_file, 'processed!')
 
-        with open(data_file, 'w') as f:
-            pickle.dump(Data, f)
-
-    return Data
+    return data_file
 
 
 def make_dataset(n=None, n_jobs=1, rootpath='', output_path='',
-                 annot_beats=False):
+                 annot_beats=False, out_path=None):
+    """Computes the training data of the dataset in `rootpath` and writes
+    it in the columnar format (see `train_data`) into `out_path`.
 
+    The workers only return the paths to the per-track caches, which are
+    then streamed one by one into the training set.
+    """
     audio_files = msaf.io.get_dataset_files(rootpath)
 
     if n is None:
         n = len(audio_files)
 
-    data = Parallel(n_jobs=n_jobs)(delayed(import_data)(
+    data_files = Parallel(n_jobs=n_jobs)(delayed(import_data)(
         file_struct, rootpath, output_path, annot_beats)
         for file_struct in audio_files[:n])
 
-    X, Y, B, T, F, L = [], [], [], [], [], []
-    for d in data:
-        if d is None:
-            continue
-        X.append(d['features'])
-        Y.append(d['segments'])
-        B.append(d['beats'])
-        T.append(d['segment_times'])
-        F.append(d['filename'])
-        L.append(d['segment_labels'])
-
-    return X, Y, B, T, F, L
+    with TrainingSetWriter(out_path) as writer:
+        for data_file in data_files:
+            if data_file is None:
+                continue
+            with np.load(data_file) as d:
+                writer.append(d['features'], d['segments'], d['beats'],
+                              d['segment_times'], str(d['filename']),
+                              d['segment_labels'])
 
 
 if __name__ == '__main__':
@@ -175,21 +175,23 @@ if __name__ == '__main__':
                         default=False)
     args = parser.parse_args()
     start_time = time.time()
-    X, Y, B, T, F, L = make_dataset(n=args.n,
-                                    n_jobs=args.n_jobs,
-                                    rootpath=args.ds_path,
-                                    output_path=args.output_path,
-                                    annot_beats=args.annot_beats)
 
     ds_path = args.ds_path
     if ds_path[-1] == "/":
         ds_path = ds_path[:-1]
 
     if args.annot_beats:
-        out_path = '%s/AnnotBeats_%s_data.pickle' % (
+        out_path = '%s/AnnotBeats_%s_data' % (
             args.output_path, os.path.basename(ds_path))
     else:
-        out_path = '%s/EstBeats_%s_data.pickle' % (
+        out_path = '%s/EstBeats_%s_data' % (
             args.output_path, os.path.basename(ds_path))
-    with open(out_path, 'w') as f:
-        pickle.dump((X, Y, B, T, F, L), f)
+
+    make_dataset(n=args.n,
+                 n_jobs=args.n_jobs,
+                 rootpath=args.ds_path,
+                 output_path=args.output_path,
+                 annot_beats=args.annot_beats,
+                 out_path=out_path)
+    print("Training set written in %s (%.2f seconds)" %
+          (out_path, time.time() - start_time))
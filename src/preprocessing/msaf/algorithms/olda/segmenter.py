@@ -4,11 +4,13 @@
 '''
 import argparse
 import logging
+import os
 import sys
 
 import numpy as np
-import scipy.signal
 import scipy.linalg
+import scipy.sparse
+from sklearn.utils.extmath import randomized_svd
 
 import librosa
 import msaf
@@ -21,10 +23,20 @@ REP_FILTER = 7
 N_MFCC = 32
 N_CHROMA = 12
 N_REP = 32
+RSVD_OVERSAMPLES = 10
 
 # mfcc, chroma, repetitions for each, and 4 time features
 __DIMENSION = N_MFCC + N_CHROMA + 2 * N_REP + 4
 
+# Process-wide registry of the loaded transforms, keyed by (path, mtime).
+# The transforms are memory-mapped, so forked workers share the same pages.
+_transforms = {}
+
+# Process-wide projection buffers, keyed by dtype. Each one is a flat array
+# that grows to the largest projection seen, so it is reused by the tracks
+# processed in this process (a Segmenter is created for every track).
+_projection_buffers = {}
+
 
 def features(file_struct, annot_beats=False, framesync=False):
     '''Feature-extraction for audio segmentation
@@ -48,45 +60,55 @@ def features(file_struct, annot_beats=False, framesync=False):
 
     '''
     def compress_data(X, k):
-        Xtemp = X.dot(X.T)
-        if len(Xtemp) == 0:
+        # Project onto the k leading left singular vectors of X, normalized
+        # by the leading singular value of X. The output always has k rows.
+        if X.shape[0] == 0:
             return None
-        e_vals, e_vecs = np.linalg.eig(Xtemp)
-
-        e_vals = np.maximum(0.0, np.real(e_vals))
-        e_vecs = np.real(e_vecs)
 
-        idx = np.argsort(e_vals)[::-1]
-
-        e_vals = e_vals[idx]
-        e_vecs = e_vecs[:, idx]
+        if min(X.shape) > k + RSVD_OVERSAMPLES:
+            # Truncated SVD, avoiding the eigendecomposition of X.dot(X.T)
+            _, s, Vt = randomized_svd(X, k, n_oversamples=RSVD_OVERSAMPLES,
+                                      random_state=0)
+        else:
+            if scipy.sparse.issparse(X):
+                X = X.toarray()
+            _, s, Vt = scipy.linalg.svd(X, full_matrices=False)
+            s = s[:k]
+            Vt = Vt[:k]
 
-        # Truncate to k dimensions
-        if k < len(e_vals):
-            e_vals = e_vals[:k]
-            e_vecs = e_vecs[:, :k]
+        Y = np.zeros((k, X.shape[1]))
+        Y[:len(s)] = s[:, np.newaxis] * Vt
 
         # Normalize by the leading singular value of X
-        Z = np.sqrt(e_vals.max())
-
+        Z = s.max()
         if Z > 0:
-            e_vecs = e_vecs / Z
+            Y /= Z
 
-        return e_vecs.T.dot(X)
+        return Y
 
     # Latent factor repetition features
     def repetition(X, metric='euclidean'):
         R = librosa.segment.recurrence_matrix(
             X, k=2 * int(np.ceil(np.sqrt(X.shape[1]))),
-            width=REP_WIDTH, metric=metric, sym=False).astype(np.float32)
-
-        P = scipy.signal.medfilt2d(librosa.segment.recurrence_to_lag(R),
-                                   [1, REP_FILTER])
+            width=REP_WIDTH, metric=metric, sym=False, sparse=True)
+        L = librosa.segment.recurrence_to_lag(R).astype(np.float32).tocsr()
+
+        # The lag matrix is binary, so median filtering along time is a
+        # majority vote over REP_FILTER frames. Count the votes with a
+        # banded (zero-padded) product to keep the matrix sparse.
+        half = REP_FILTER // 2
+        band = scipy.sparse.diags([1] * REP_FILTER,
+                                  np.arange(-half, half + 1),
+                                  shape=(L.shape[1], L.shape[1]),
+                                  format="csr", dtype=np.float32)
+        P = L.dot(band)
+        P.data = (P.data > half).astype(np.float32)
+        P.eliminate_zeros()
 
         # Discard empty rows.
         # This should give an equivalent SVD, but resolves some numerical
         # instabilities.
-        P = P[P.any(axis=1)]
+        P = P[np.diff(P.indptr) > 0]
 
         return compress_data(P, N_REP)
 
@@ -236,15 +258,87 @@ def process_arguments():
 
 
 def load_transform(transform_file):
-
+    """Loads the OLDA transform, reusing it if it was already loaded.
+
+    Each transform file is memory-mapped only once per process, and it is
+    reloaded if the file changes on disk. Loading the transforms before
+    forking workers lets them share the mapped pages copy-on-write.
+
+    Parameters
+    ----------
+    transform_file: str
+        Path to the npy file containing the transform. `None` for the
+        identity transform.
+
+    Returns
+    -------
+    W: np.array
+        The (read-only) transform.
+    """
     if transform_file is None:
-        W = np.eye(__DIMENSION)
-    else:
-        W = np.load(transform_file)
+        return np.eye(__DIMENSION)
+
+    transform_file = os.path.realpath(transform_file)
+    key = (transform_file, os.path.getmtime(transform_file))
+    W = _transforms.get(key)
+    if W is None:
+        # Drop stale versions of the same file
+        for old_key in [k for k in _transforms if k[0] == transform_file]:
+            del _transforms[old_key]
+        W = np.load(transform_file, mmap_mode="r")
+        _transforms[key] = W
 
     return W
 
 
+def preload(config):
+    """Loads the transform of the given configuration, so that the workers
+    forked afterwards share it (see `msaf.run.preload_algorithms`)."""
+    load_transform(config["transform"])
+
+
+def project_features(W, F, out=None):
+    """Projects the features with the given transform, i.e., `W.dot(F)`.
+
+    Parameters
+    ----------
+    W: np.array(d', d)
+        The transform.
+    F: np.array(d, N)
+        The features, each column representing a beat.
+    out: np.array
+        Preallocated buffer where to write the projection. It is reused if
+        it has the right shape and type; otherwise a new one is allocated.
+
+    Returns
+    -------
+    out: np.array(d', N)
+        The projected features.
+    """
+    shape = (W.shape[0], F.shape[1])
+    dtype = np.result_type(W, F)
+    if out is None or out.shape != shape or out.dtype != dtype or \
+            not out.flags.c_contiguous:
+        out = np.empty(shape, dtype=dtype)
+    return np.dot(W, F, out=out)
+
+
+def get_projection_buffer(shape, dtype):
+    """Returns a C-contiguous array of the given shape and type, backed by
+    the projection buffer of this process.
+
+    The content of the array is overwritten by the next call, so it must
+    not be kept once the track has been processed.
+    """
+    dtype = np.dtype(dtype)
+    size = int(np.prod(shape))
+    buf = _projection_buffers.get(dtype)
+    if buf is None or buf.size < size:
+        buf = np.empty(size, dtype=dtype)
+        _projection_buffers[dtype] = buf
+    return buf[:size].reshape(shape)
+
+
 def get_num_segs(duration, MIN_SEG=10.0, MAX_SEG=45.0):
     kmin = max(1, np.floor(duration / MAX_SEG).astype(int))
     kmax = max(2, np.ceil(duration / MIN_SEG).astype(int))
@@ -262,6 +356,14 @@ class Segmenter(SegmenterInterface):
 
     .. _PDF: https://bmcfee.github.io/papers/icassp2014_segments.pdf
     """
+    def _project(self, F):
+        """Loads the transform (if needed) and applies it to the features,
+        reusing the projection buffer of the process."""
+        W = load_transform(self.config["transform"])
+        out = get_projection_buffer((W.shape[0], F.shape[1]),
+                                    np.result_type(W, F))
+        return project_features(W, F, out=out)
+
     def processFlat(self):
         """Main process for flat segmentation.
         Returns
@@ -276,8 +378,7 @@ class Segmenter(SegmenterInterface):
 
         try:
             # Load and apply transform
-            W = load_transform(self.config["transform"])
-            F = W.dot(F)
+            F = self._project(F)
 
             # Get Segments
             kmin, kmax = get_num_segs(dur)
@@ -315,8 +416,7 @@ class Segmenter(SegmenterInterface):
 
         try:
             # Load and apply transform
-            W = load_transform(self.config["transform"])
-            F = W.dot(F)
+            F = self._project(F)
 
             # Get Segments
             kmin, kmax = get_num_segs(dur)
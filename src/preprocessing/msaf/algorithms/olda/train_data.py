@@ -0,0 +1,223 @@
+"""
+Columnar on-disk format for the OLDA training data.
+
+A training set is a directory where the per-track arrays are concatenated
+into single arrays, plus the offsets delimiting each track:
+
+    index.json              Number of tracks, frames and features, dtype and
+                            file names.
+    features.bin            Raw (n_frames, n_features) feature matrix,
+                            frames of all tracks one after the other.
+    frame_offsets.npy       Track offsets into the frames (n_tracks + 1).
+    beats.npy               Beat times of each frame.
+    segments.npy            Beat-aligned segment boundaries of each track.
+    segment_offsets.npy     Track offsets into the segments (n_tracks + 1).
+    segment_labels.npy      Label of each segment in `segments.npy`.
+    segment_times.npy       True segment times of each track.
+    time_offsets.npy        Track offsets into the segment times.
+
+All the arrays are memory-mapped when loading, so tracks can be streamed or
+sliced without copying them into memory.
+"""
+import json
+import os
+
+import numpy as np
+
+INDEX_FILE = "index.json"
+FEATURES_FILE = "features.bin"
+FEATURES_DTYPE = np.float64
+
+
+class RaggedColumn(object):
+    """Read-only sequence of the per-track slices of a concatenated array."""
+    def __init__(self, data, offsets, transpose=False):
+        """
+        Parameters
+        ----------
+        data: np.array
+            Concatenated array, tracks along the first axis.
+        offsets: np.array(n_tracks + 1)
+            Start of each track in `data`, followed by the total length.
+        transpose: bool
+            Whether to return the transposed slices (e.g., to obtain
+            `(n_features, n_frames)` feature matrices).
+        """
+        self.data = data
+        self.offsets = offsets
+        self.transpose = transpose
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Track index %d out of range" % i)
+        item = self.data[self.offsets[i]:self.offsets[i + 1]]
+        return item.T if self.transpose else item
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class TrainingSet(object):
+    """OLDA training set stored in the columnar format.
+
+    The columns `X` (features, `(n_features, n_frames)` per track), `Y`
+    (segment boundaries in beats), `B` (beat times), `T` (true segment
+    times), `F` (file names), and `L` (segment labels) behave as lists of
+    per-track arrays, so they can be passed directly to `OLDA.fit`.
+    """
+    def __init__(self, path, mmap_mode="r"):
+        """Loads (memory-maps) the training set in the given directory.
+
+        Parameters
+        ----------
+        path: str
+            Directory of the training set.
+        mmap_mode: str
+            Memory-map mode for the arrays (`None` to read them in memory).
+        """
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            self.index = json.load(f)
+
+        shape = (self.index["n_frames"], self.index["n_features"])
+        if shape[0] == 0 or mmap_mode is None:
+            features = np.fromfile(os.path.join(path, FEATURES_FILE),
+                                   dtype=self.index["dtype"]).reshape(shape)
+        else:
+            features = np.memmap(os.path.join(path, FEATURES_FILE),
+                                 dtype=self.index["dtype"], mode=mmap_mode,
+                                 shape=shape)
+
+        def load(name):
+            return np.load(os.path.join(path, name + ".npy"),
+                           mmap_mode=mmap_mode)
+
+        frame_offsets = load("frame_offsets")
+        segment_offsets = load("segment_offsets")
+        self.X = RaggedColumn(features, frame_offsets, transpose=True)
+        self.B = RaggedColumn(load("beats"), frame_offsets)
+        self.Y = RaggedColumn(load("segments"), segment_offsets)
+        self.L = RaggedColumn(load("segment_labels"), segment_offsets)
+        self.T = RaggedColumn(load("segment_times"), load("time_offsets"))
+        self.F = self.index["filenames"]
+
+    def __len__(self):
+        return len(self.F)
+
+    def __getitem__(self, i):
+        """Returns the tuple (X, Y, B, T, F, L) of the i-th track."""
+        return self.X[i], self.Y[i], self.B[i], self.T[i], self.F[i], \
+            self.L[i]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class TrainingSetWriter(object):
+    """Writes a training set in the columnar format, one track at a time.
+
+    The features are appended to disk as they come, so only the small
+    per-track arrays (beats, segments) are kept in memory until `close`.
+    """
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path: str
+            Output directory of the training set.
+        """
+        self.path = path
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self._features_fp = open(os.path.join(path, FEATURES_FILE), "wb")
+        self._n_features = None
+        self._frame_offsets = [0]
+        self._segment_offsets = [0]
+        self._time_offsets = [0]
+        self._beats = []
+        self._segments = []
+        self._labels = []
+        self._times = []
+        self._filenames = []
+
+    def append(self, X, Y, B, T, F, L):
+        """Appends a track to the training set.
+
+        Parameters
+        ----------
+        X: np.array(n_features, n_frames)
+            Features of the track.
+        Y: np.array
+            Beat-aligned segment boundaries.
+        B: np.array(n_frames)
+            Beat times.
+        T: np.array
+            True segment times.
+        F: str
+            File name of the track.
+        L: list
+            Segment labels (as many as segment boundaries in `Y`).
+        """
+        X = np.asarray(X, dtype=FEATURES_DTYPE)
+        if self._n_features is None:
+            self._n_features = X.shape[0]
+        elif X.shape[0] != self._n_features:
+            raise ValueError("Track %s has %d features, expected %d" %
+                             (F, X.shape[0], self._n_features))
+        if len(B) != X.shape[1] or len(L) != len(Y):
+            raise ValueError("Inconsistent number of beats or segments in "
+                             "track %s" % F)
+
+        np.ascontiguousarray(X.T).tofile(self._features_fp)
+        self._frame_offsets.append(self._frame_offsets[-1] + X.shape[1])
+        self._segment_offsets.append(self._segment_offsets[-1] + len(Y))
+        self._time_offsets.append(self._time_offsets[-1] + len(T))
+        self._beats.append(np.asarray(B, dtype=float))
+        self._segments.append(np.asarray(Y, dtype=int))
+        self._labels.append(np.asarray(L, dtype=str))
+        self._times.append(np.asarray(T, dtype=float))
+        self._filenames.append(F)
+
+    def close(self):
+        """Writes the index and the per-track arrays."""
+        if self._features_fp.closed:
+            return
+        self._features_fp.close()
+
+        def save(name, arrays, dtype):
+            data = np.concatenate(arrays) if arrays else np.empty(0, dtype)
+            np.save(os.path.join(self.path, name + ".npy"),
+                    np.asarray(data, dtype=dtype))
+
+        save("frame_offsets", [self._frame_offsets], int)
+        save("segment_offsets", [self._segment_offsets], int)
+        save("time_offsets", [self._time_offsets], int)
+        save("beats", self._beats, float)
+        save("segments", self._segments, int)
+        save("segment_labels", self._labels, str)
+        save("segment_times", self._times, float)
+
+        index = {
+            "n_tracks": len(self._filenames),
+            "n_frames": self._frame_offsets[-1],
+            "n_features": self._n_features or 0,
+            "dtype": np.dtype(FEATURES_DTYPE).str,
+            "filenames": self._filenames
+        }
+        with open(os.path.join(self.path, INDEX_FILE), "w") as f:
+            json.dump(index, f, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -6,7 +6,11 @@ config = {
     "scluster_k" : 4,    # How many unique labels to have (only for the flat case)
     "evec_smooth": 9,
     "rec_smooth" : 9,
-    "rec_width"  : 9
+    "rec_width"  : 9,
+    "sparse_laplacian": False,  # Sparse affinities and partial eigensolver (for long, e.g. framesync, tracks)
+    "layered_kmeans": False,    # Seed the k-means of each layer from the previous one (only for the hierarchical case)
+    "layered_kmeans_n_init": 3, # k-means++ restarts of each layer
+    "layered_kmeans_n_jobs": 1  # Jobs to run the restarts of all layers
 }
 
 algo_id = "scluster"
@@ -4,36 +4,136 @@
 # Code source: Brian McFee
 # License: ISC
 
-from collections import defaultdict
 import numpy as np
 import scipy
+import scipy.sparse
+import scipy.sparse.csgraph
+import scipy.sparse.linalg
 
 import sklearn.cluster
+from joblib import Parallel, delayed
 
 import librosa
 
-
-def embed_beats(A_rep, A_loc, config):
+# Shift of the shift-invert mode of the sparse eigensolver (the normalized
+# Laplacian is singular, so the shift is slightly below its spectrum)
+EIGSH_SIGMA = -1e-3
+
+
+def sparse_timelag_median_filter(R, size):
+    """Sparse counterpart of
+    `librosa.segment.timelag_filter(scipy.ndimage.median_filter)(R,
+    size=(1, size))`.
+
+    The affinities are non-negative, so the median of a window is zero unless
+    more than half of it is non-zero. Only the lags with enough non-zero
+    entries are filtered (densely, one lag at a time).
+    """
+    L = librosa.segment.recurrence_to_lag(R, pad=True).tocsr()
+
+    # The reflection at the edges can at most double the entries of a window
+    nnz = np.diff(L.indptr)
+    rows, cols, vals = [], [], []
+    for lag in np.flatnonzero(2 * nnz > size // 2):
+        row = scipy.ndimage.median_filter(L[lag].toarray().ravel(), size=size)
+        idx = np.flatnonzero(row)
+        rows.append(np.full(len(idx), lag))
+        cols.append(idx)
+        vals.append(row[idx])
+
+    if rows:
+        rows, cols, vals = map(np.concatenate, (rows, cols, vals))
+    Lf = scipy.sparse.csr_matrix((vals, (rows, cols)), shape=L.shape)
+    return librosa.segment.lag_to_recurrence(Lf).tocsr()
+
+
+def lower_symmetric(L):
+    """Symmetric sparse matrix with the lower triangle of L, i.e., the matrix
+    whose eigenvectors `scipy.linalg.eigh(L)` computes (the time-lag filter
+    of the affinities makes L slightly asymmetric)."""
+    lower = scipy.sparse.tril(L, format='csr')
+    return (lower + scipy.sparse.tril(L, k=-1, format='csr').T).tocsr()
+
+
+def smallest_eigenvectors(L, k):
+    """Eigenvectors of the k smallest eigenvalues of the sparse symmetric
+    matrix L, in ascending order of the eigenvalues."""
+    n = L.shape[0]
+    if k >= n - 1:
+        evals, evecs = scipy.linalg.eigh(L.toarray())
+        return evecs[:, :k]
+
+    try:
+        evals, evecs = scipy.sparse.linalg.eigsh(L, k=k, sigma=EIGSH_SIGMA,
+                                                 which='LM')
+    except (RuntimeError, scipy.sparse.linalg.ArpackError):
+        # Fall back to LOBPCG if the factorization or ARPACK fails
+        X0 = np.random.RandomState(0).rand(n, k)
+        evals, evecs = scipy.sparse.linalg.lobpcg(L, X0, largest=False,
+                                                  tol=1e-6, maxiter=500)
+
+    idx = np.argsort(evals)
+    return evecs[:, idx]
+
+
+def embed_beats(A_rep, A_loc, config, n_evecs=None):
+    """Computes the Laplacian embedding of the beats.
+
+    With `config["sparse_laplacian"]`, the affinities are kept sparse and
+    only the first `n_evecs` eigenvectors are computed, otherwise all of
+    them are computed from the dense Laplacian.
+
+    Both paths give the same eigenvectors (up to their signs), and thus the
+    same segmentation:
+
+    >>> rng = np.random.RandomState(0)
+    >>> sections = np.repeat([0, 1, 2, 1, 0, 3, 2, 1], 50)
+    >>> C = (rng.rand(4, 12)[sections] + 0.3 * rng.rand(400, 12)).T
+    >>> config = {"rec_width": 9, "rec_smooth": 9, "evec_smooth": 9,
+    ...           "hier": True, "num_layers": 10, "layered_kmeans": False}
+    >>> dense = embed_beats(C, C, dict(config, sparse_laplacian=False))
+    >>> sparse = embed_beats(C, C, dict(config, sparse_laplacian=True), 10)
+    >>> max(scipy.linalg.subspace_angles(dense[:, :k], sparse[:, :k]).max()
+    ...     for k in range(1, 11)) < 1e-6
+    True
+    >>> np.random.seed(0)
+    >>> dense_idxs, _, _ = do_segmentation(
+    ...     C, C, dict(config, sparse_laplacian=False))
+    >>> np.random.seed(0)
+    >>> sparse_idxs, _, _ = do_segmentation(
+    ...     C, C, dict(config, sparse_laplacian=True))
+    >>> all(np.array_equal(dense_idx, sparse_idx)
+    ...     for dense_idx, sparse_idx in zip(dense_idxs, sparse_idxs))
+    True
+    """
+    sparse = config["sparse_laplacian"]
 
     R = librosa.segment.recurrence_matrix(A_rep, width=config["rec_width"],
                                           mode='affinity',
                                           metric='cosine',
-                                          sym=True)
+                                          sym=True, sparse=sparse)
 
     # Enhance diagonals with a median filter (Equation 2)
-    df = librosa.segment.timelag_filter(scipy.ndimage.median_filter)
-    Rf = df(R, size=(1, config["rec_smooth"]))
+    if sparse:
+        Rf = sparse_timelag_median_filter(R, config["rec_smooth"])
+    else:
+        df = librosa.segment.timelag_filter(scipy.ndimage.median_filter)
+        Rf = df(R, size=(1, config["rec_smooth"]))
 
     path_distance = np.sum(np.diff(A_loc, axis=1)**2, axis=0)
     sigma = np.median(path_distance)
     path_sim = np.exp(-path_distance / sigma)
 
-    R_path = np.diag(path_sim, k=1) + np.diag(path_sim, k=-1)
+    if sparse:
+        R_path = scipy.sparse.diags([path_sim, path_sim], [1, -1],
+                                    format='csr')
+    else:
+        R_path = np.diag(path_sim, k=1) + np.diag(path_sim, k=-1)
 
     ##########################################################
     # And compute the balanced combination (Equations 6, 7, 9)
-    deg_path = np.sum(R_path, axis=1)
-    deg_rec = np.sum(Rf, axis=1)
+    deg_path = np.asarray(R_path.sum(axis=1)).ravel()
+    deg_rec = np.asarray(Rf.sum(axis=1)).ravel()
 
     mu = deg_path.dot(deg_path + deg_rec) / np.sum((deg_path + deg_rec)**2)
 
@@ -44,7 +144,10 @@ def embed_beats(A_rep, A_loc, config):
     L = scipy.sparse.csgraph.laplacian(A, normed=True)
 
     # and its spectral decomposition
-    evals, evecs = scipy.linalg.eigh(L)
+    if sparse:
+        evecs = smallest_eigenvectors(lower_symmetric(L), n_evecs)
+    else:
+        evals, evecs = scipy.linalg.eigh(L)
 
     # We can clean this up further with a median filter.
     # This can help smooth over small discontinuities
@@ -53,10 +156,97 @@ def embed_beats(A_rep, A_loc, config):
     return evecs
 
 
-def cluster(evecs, Cnorm, k, in_bound_idxs=None):
-    X = evecs[:, :k] / (Cnorm[:, k - 1:k] + 1e-5)
-    KM = sklearn.cluster.KMeans(n_clusters=k, n_init=50, max_iter=500)
+def layer_features(evecs, Cnorm, k):
+    """Normalized features of the k-th layer (first k eigenvectors)."""
+    return evecs[:, :k] / (Cnorm[:, k - 1:k] + 1e-5)
+
+
+def _fit_kmeans(X, k, init, n_init, max_iter):
+    """Runs k-means and returns its inertia and labels."""
+    KM = sklearn.cluster.KMeans(n_clusters=k, init=init, n_init=n_init,
+                                max_iter=max_iter)
     seg_ids = KM.fit_predict(X)
+    return KM.inertia_, seg_ids
+
+
+def split_most_dispersed(X, seg_ids, k):
+    """Initial centroids for k clusters of X, from the labels `seg_ids` of
+    k - 1 clusters: the centroids of these clusters, where the one with the
+    largest within-cluster sum of squares is split in two along its
+    principal axis."""
+    counts = np.bincount(seg_ids, minlength=k - 1)
+    centers = np.zeros((k - 1, X.shape[1]))
+    np.add.at(centers, seg_ids, X)
+    centers /= np.maximum(counts, 1)[:, np.newaxis]
+
+    sse = np.bincount(seg_ids, minlength=k - 1,
+                      weights=np.sum((X - centers[seg_ids]) ** 2, axis=1))
+    j = np.argmax(sse)
+    D = X[seg_ids == j] - centers[j]
+    step = np.zeros(X.shape[1])
+    if len(D) > 1:
+        _, sv, Vt = np.linalg.svd(D, full_matrices=False)
+        step = Vt[0] * sv[0] / np.sqrt(len(D))
+
+    return np.vstack([centers[:j], centers[j] - step, centers[j + 1:],
+                      centers[j] + step])
+
+
+def layered_kmeans(evecs, Cnorm, ks, n_init=3, max_iter=500, n_jobs=1):
+    """Clusters the layers of a hierarchy with k-means, seeding each layer
+    from the previous one.
+
+    The clusters of layer k are initialized from the centroids of layer
+    k - 1 with its most dispersed cluster split in two, and compared with
+    `n_init` k-means++ restarts (which don't depend on the other layers,
+    so they are run for all layers in parallel). The solution with the
+    lowest inertia is kept.
+
+    Parameters
+    ----------
+    evecs: np.array
+        Laplacian eigenvectors, one row per frame.
+    Cnorm: np.array
+        Cumulative norms of the eigenvectors.
+    ks: list
+        Number of clusters of each layer, in increasing order.
+    n_init: int >= 0
+        Number of k-means++ restarts of each layer.
+    max_iter: int
+        Maximum number of k-means iterations.
+    n_jobs: int
+        Number of jobs to run the restarts.
+
+    Returns
+    -------
+    seg_ids: list
+        Cluster index of each frame, for each layer.
+    """
+    restarts = [None] * len(ks)
+    if n_init > 0:
+        restarts = Parallel(n_jobs=n_jobs)(delayed(_fit_kmeans)(
+            layer_features(evecs, Cnorm, k), k, 'k-means++', n_init, max_iter)
+            for k in ks)
+
+    seg_ids = []
+    for i, k in enumerate(ks):
+        X = layer_features(evecs, Cnorm, k)
+        candidates = [] if restarts[i] is None else [restarts[i]]
+        if i > 0 and ks[i - 1] == k - 1:
+            init = split_most_dispersed(X, seg_ids[-1], k)
+            candidates.append(_fit_kmeans(X, k, init, 1, max_iter))
+        elif not candidates:
+            candidates.append(_fit_kmeans(X, k, 'k-means++', 1, max_iter))
+        seg_ids.append(min(candidates, key=lambda c: c[0])[1])
+
+    return seg_ids
+
+
+def cluster(evecs, Cnorm, k, in_bound_idxs=None, seg_ids=None):
+    if seg_ids is None:
+        X = layer_features(evecs, Cnorm, k)
+        KM = sklearn.cluster.KMeans(n_clusters=k, n_init=50, max_iter=500)
+        seg_ids = KM.fit_predict(X)
 
     ###############################################################
     # Locate segment boundaries from the label sequence
@@ -80,31 +270,38 @@ def cluster(evecs, Cnorm, k, in_bound_idxs=None):
 def _reindex_labels(ref_int, ref_lab, est_int, est_lab):
     # for each estimated label
     #    find the reference label that is maximally overlaps with
-
-    score_map = defaultdict(lambda: 0)
-
-    for r_int, r_lab in zip(ref_int, ref_lab):
-        for e_int, e_lab in zip(est_int, est_lab):
-            score_map[(e_lab, r_lab)] += max(0, min(e_int[1], r_int[1]) -
-                                             max(e_int[0], r_int[0]))
-
-    r_taken = set()
+    ref_int = np.asarray(ref_int, dtype=float).reshape((-1, 2))
+    est_int = np.asarray(est_int, dtype=float).reshape((-1, 2))
+    r_labs, r_idx = np.unique(ref_lab, return_inverse=True)
+    e_labs, e_idx = np.unique(est_lab, return_inverse=True)
+
+    # Overlap of every (estimated, reference) pair of intervals
+    overlap = np.minimum(est_int[:, np.newaxis, 1], ref_int[np.newaxis, :, 1]) - \
+        np.maximum(est_int[:, np.newaxis, 0], ref_int[np.newaxis, :, 0])
+    np.maximum(overlap, 0, out=overlap)
+
+    # and of every (estimated, reference) pair of labels
+    E = np.zeros((len(e_idx), len(e_labs)))
+    E[np.arange(len(e_idx)), e_idx] = 1
+    R = np.zeros((len(r_idx), len(r_labs)))
+    R[np.arange(len(r_idx)), r_idx] = 1
+    score = E.T.dot(overlap).dot(R)
+
+    # Greedy matching by decreasing score. The matrix is flipped so that
+    # argmax breaks ties towards the largest labels, as sorting the
+    # (score, (e_lab, r_lab)) pairs in reverse order would.
+    score = score[::-1, ::-1]
     e_map = dict()
-
-    hits = [(score_map[k], k) for k in score_map]
-    hits = sorted(hits, reverse=True)
-
-    while hits:
-        cand_v, (e_lab, r_lab) = hits.pop(0)
-        if r_lab in r_taken or e_lab in e_map:
-            continue
-        e_map[e_lab] = r_lab
-        r_taken.add(r_lab)
+    for _ in range(min(score.shape)):
+        e, r = np.unravel_index(np.argmax(score), score.shape)
+        e_map[e_labs[-1 - e]] = r_labs[-1 - r]
+        score[e, :] = -np.inf
+        score[:, r] = -np.inf
 
     # Anything left over is unused
-    unused = set(est_lab) - set(ref_lab)
+    unused = sorted(set(e_labs) - set(r_labs))
 
-    for e, u in zip(set(est_lab) - set(e_map.keys()), unused):
+    for e, u in zip(sorted(set(e_labs) - set(e_map.keys())), unused):
         e_map[e] = u
 
     return [e_map[e] for e in est_lab]
@@ -121,14 +318,26 @@ def reindex(hierarchy):
 
 
 def do_segmentation(C, M, config, in_bound_idxs=None):
-    embedding = embed_beats(C, M, config)
+    # Only the first eigenvectors are used for clustering
+    if config["hier"]:
+        n_evecs = config["num_layers"]
+    else:
+        n_evecs = config["scluster_k"]
+    embedding = embed_beats(C, M, config, n_evecs)
     Cnorm = np.cumsum(embedding ** 2, axis=1) ** 0.5
 
     if config["hier"]:
         est_idxs = []
         est_labels = []
-        for k in range(1, config["num_layers"] + 1):
-            est_idx, est_label = cluster(embedding, Cnorm, k)
+        ks = list(range(1, config["num_layers"] + 1))
+        if config["layered_kmeans"]:
+            layers_ids = layered_kmeans(
+                embedding, Cnorm, ks, n_init=config["layered_kmeans_n_init"],
+                n_jobs=config["layered_kmeans_n_jobs"])
+        else:
+            layers_ids = [None] * len(ks)
+        for k, seg_ids in zip(ks, layers_ids):
+            est_idx, est_label = cluster(embedding, Cnorm, k, seg_ids=seg_ids)
             est_idxs.append(est_idx)
             est_labels.append(np.asarray(est_label, dtype=np.int))
 
@@ -137,3 +346,8 @@ def do_segmentation(C, M, config, in_bound_idxs=None):
         est_labels = np.asarray(est_labels, dtype=np.int)
 
     return est_idxs, est_labels, Cnorm
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -61,7 +61,7 @@ class Segmenter(SegmenterInterface):
         """
         self.config["hier"] = False
         est_idxs, est_labels, F = self.process()
-        assert est_idxs[0] == 0 and est_idxs[-1] == F.shape[1] - 1
+        assert est_idxs[0] == 0 and est_idxs[-1] == F.shape[0] - 1
         return self._postprocess(est_idxs, est_labels)
 
     def processHierarchical(self):
@@ -79,7 +79,7 @@ class Segmenter(SegmenterInterface):
         est_idxs, est_labels, F = self.process()
         for layer in range(len(est_idxs)):
             assert est_idxs[layer][0] == 0 and \
-                est_idxs[layer][-1] == F.shape[1] - 1
+                est_idxs[layer][-1] == F.shape[0] - 1
             est_idxs[layer], est_labels[layer] = \
                 self._postprocess(est_idxs[layer], est_labels[layer])
         return est_idxs, est_labels
@@ -7,5 +7,6 @@ Variable Markov Oracle
     Segmenter
 """
 from .config import *
-from .segmenter import *
-from .main import *
\ No newline at end of file
+from msaf.algorithms import lazy_submodules
+
+__getattr__ = lazy_submodules(__name__, "segmenter", "main")
@@ -7,6 +7,10 @@ config = {
     "median_filter_width": 9,
     "hier_num_layers": 10,  # How many hierarchical layers to compute (only for the hierarchical case)
     "vmo_k": 10,
+    "layered_kmeans": False,  # Seed the k-means of each layer from the previous one (only for the hierarchical case)
+    "layered_kmeans_n_init": 3,  # k-means++ restarts of each layer
+    "layered_kmeans_n_jobs": 1,  # Jobs to run the restarts of all layers
+    "oracle_cache_dir": None,  # Directory where to keep the oracle of each track (None to disable)
 }
 
 algo_id = "vmo"  # Identifier of the algorithm
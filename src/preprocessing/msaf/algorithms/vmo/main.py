@@ -1,4 +1,8 @@
 
+import hashlib
+import os
+import pickle
+import tempfile
 import sklearn
 import numpy as np
 import vmo
@@ -7,11 +11,56 @@ import scipy.linalg
 import scipy.ndimage
 import librosa
 
+from msaf.algorithms.scluster.main2 import layer_features, layered_kmeans
+
+
+def feature_hash(feature):
+    """Hash of the contents, shape and type of a feature matrix."""
+    feature = np.ascontiguousarray(feature)
+    h = hashlib.sha1(feature.tobytes())
+    h.update(str((feature.shape, feature.dtype.str)).encode())
+    return h.hexdigest()
+
+
+def vmo_routine(feature, cache_dir=None):
+    """Builds the oracle of the features, with the threshold found by
+    `vmo.find_threshold`.
+
+    If `cache_dir` is given, the threshold and the oracle of each feature
+    matrix are stored there (keyed by `feature_hash`), and reused when the
+    same features are segmented again. The entries are pickles, so the
+    directory must only be writable by trusted users. It is never cleaned
+    up automatically.
+    """
+    cache_file = None
+    if cache_dir:
+        cache_file = os.path.join(cache_dir, feature_hash(feature) + ".pkl")
+        if os.path.isfile(cache_file):
+            try:
+                with open(cache_file, "rb") as f:
+                    return pickle.load(f)["oracle"]
+            except (IOError, EOFError, KeyError, pickle.UnpicklingError):
+                pass
 
-def vmo_routine(feature):
     ideal_t = vmo.find_threshold(feature, dim=feature.shape[1])
     oracle = vmo.build_oracle(feature, flag='a', threshold=ideal_t[0][1], dim=feature.shape[1])
 
+    if cache_file is not None:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # Write to a temporary file first, so that concurrent runs never
+        # read a partial entry
+        f = tempfile.NamedTemporaryFile(dir=cache_dir, suffix=".tmp",
+                                        delete=False)
+        try:
+            with f:
+                pickle.dump({"threshold": ideal_t[0][1], "oracle": oracle},
+                            f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.rename(f.name, cache_file)
+        finally:
+            if os.path.exists(f.name):
+                os.remove(f.name)
+
     return oracle
 
 
@@ -33,24 +82,26 @@ def connectivity_from_vmo(oracle, config):
 
 
 def eigen_decomposition(mat, k=6):  # Changed from 11 to 8 then to 6(7/22)
-    vals, vecs = scipy.linalg.eig(mat)
-    vals = vals.real
-    vecs = vecs.real
-    idx = np.argsort(vals)
+    n = mat.shape[0]
+    if n < k + 1:
+        k = n - 1
+    if k < 1:
+        return np.zeros((n, 0))
 
-    vals = vals[idx]
-    vecs = vecs[:, idx]
+    # The connectivity is symmetric (up to the median filtering), so only
+    # the k smallest eigenpairs of its symmetric part are computed
+    mat = (mat + mat.T) / 2.
+    vals, vecs = scipy.linalg.eigh(mat, subset_by_index=[0, k - 1])
 
-    if len(vals) < k + 1:
-        k = -1
     vecs = scipy.ndimage.median_filter(vecs, size=(5,1))
-    return vecs[:, :k]
+    return vecs
 
 
-def cluster(evecs, Cnorm, k, in_bound_idxs=None):
-    X = evecs[:, :k] / (Cnorm[:, k - 1:k] + 1e-5)
-    KM = sklearn.cluster.KMeans(n_clusters=k, n_init=50, max_iter=500)
-    seg_ids = KM.fit_predict(X)
+def cluster(evecs, Cnorm, k, in_bound_idxs=None, seg_ids=None):
+    X = layer_features(evecs, Cnorm, k)
+    if seg_ids is None:
+        KM = sklearn.cluster.KMeans(n_clusters=k, n_init=50, max_iter=500)
+        seg_ids = KM.fit_predict(X)
 
     ###############################################################
     # Locate segment boundaries from the label sequence
@@ -79,7 +130,7 @@ def cluster(evecs, Cnorm, k, in_bound_idxs=None):
 
 
 def scluster_segment(feature, config, in_bound_idxs=None):
-    v_oracle = vmo_routine(feature)
+    v_oracle = vmo_routine(feature, config["oracle_cache_dir"])
     connectivity_mat = connectivity_from_vmo(v_oracle, config)
     embedding = eigen_decomposition(connectivity_mat, k=config["hier_num_layers"])
 
@@ -88,8 +139,15 @@ def scluster_segment(feature, config, in_bound_idxs=None):
     if config["hier"]:
         est_idxs = []
         est_labels = []
-        for k in range(1, config["hier_num_layers"] + 1):
-            est_idx, est_label = cluster(embedding, Cnorm, k)
+        ks = list(range(1, config["hier_num_layers"] + 1))
+        if config["layered_kmeans"]:
+            layers_ids = layered_kmeans(
+                embedding, Cnorm, ks, n_init=config["layered_kmeans_n_init"],
+                n_jobs=config["layered_kmeans_n_jobs"])
+        else:
+            layers_ids = [None] * len(ks)
+        for k, seg_ids in zip(ks, layers_ids):
+            est_idx, est_label = cluster(embedding, Cnorm, k, seg_ids=seg_ids)
             est_idxs.append(est_idx)
             est_labels.append(np.asarray(est_label, dtype=np.int))
 
@@ -5,16 +5,16 @@ here.
 """
 
 import collections
+import copy
 import datetime
 from enum import Enum
 import librosa
 import logging
-import jams
 import json
 import numpy as np
 import os
 import six
-import pypianoroll
+import zlib
 
 # Local stuff
 import msaf
@@ -174,15 +174,59 @@ class Features(six.with_metaclass(MetaFeatures)):
             -1, reshaped.shape[2])
         self._est_beatsync_features = self._ann_beatsync_features
 
+    def _get_store_key(self):
+        """Key of these features (identifier and parameters) in the in-memory
+        features store of the file structure."""
+        params = []
+        for param_name in sorted(self.get_param_names()):
+            value = getattr(self, param_name)
+            if hasattr(value, '__call__'):
+                value = value.__name__
+            params.append((param_name, str(value)))
+        return self.get_id(), tuple(params)
+
+    def _read_store_features(self):
+        """Reads the features from the in-memory features store."""
+        stored = self.file_struct.features_store.get(self._get_store_key())
+        if stored is None:
+            raise FeaturesNotFound("The features %s have not been computed "
+                                   "for %s" % (self.get_id(),
+                                               self.file_struct.audio_file))
+        for name, value in stored.items():
+            setattr(self, name, value)
+
+    def _write_store_features(self):
+        """Saves the features to the in-memory features store."""
+        self.file_struct.features_store[self._get_store_key()] = dict(
+            (name, getattr(self, name)) for name in self._stored_attributes)
+
+    def _get_noise_seed(self):
+        """Seed of the random noise added to these features, derived from the
+        track and the features (identifier and parameters), so that they do
+        not depend on where or when they are computed."""
+        key = (os.path.basename(self.file_struct.audio_file),
+               self._get_store_key())
+        return zlib.crc32(repr(key).encode())
+
+    # Attributes kept in the in-memory features store
+    _stored_attributes = ["dur", "tempo", "_framesync_features",
+                          "_est_beatsync_features", "_ann_beatsync_features",
+                          "_est_beats_times", "_est_beatsync_times",
+                          "_ann_beats_times", "_ann_beatsync_times",
+                          "_framesync_times"]
+
     def read_features(self, tol=1e-3):
-        """Reads the features from a file and stores them in the current
-        object.
+        """Reads the features from a file (or from the in-memory features
+        store of the file structure, if it has no features file) and stores
+        them in the current object.
 
         Parameters
         ----------
         tol: float
             Tolerance level to detect duration of audio.
         """
+        if self.file_struct.features_file is None:
+            return self._read_store_features()
         try:
             # Read JSON file
             with open(self.file_struct.features_file) as f:
@@ -253,7 +297,10 @@ class Features(six.with_metaclass(MetaFeatures)):
                                       self.file_struct.features_file)
 
     def write_features(self):
-        """Saves features to file."""
+        """Saves features to file (or to the in-memory features store of the
+        file structure, if it has no features file)."""
+        if self.file_struct.features_file is None:
+            return self._write_store_features()
         out_json = collections.OrderedDict()
         try:
             # Only save the necessary information
@@ -329,8 +376,22 @@ class Features(six.with_metaclass(MetaFeatures)):
 
     def _compute_all_features(self):
         """Computes all the features (beatsync, framesync) from the audio."""
-        # Read multitrack
-        self._audio = pypianoroll.load(self.file_struct.audio_file)
+        # Random generator of the noise of the features (not the global one)
+        self._rng = np.random.RandomState(self._get_noise_seed())
+
+        # Imported here since pypianoroll imports matplotlib
+        import pypianoroll
+
+        # Read multitrack (only once for all the in-memory features; copied
+        # since some features binarize it in place)
+        store = getattr(self.file_struct, "features_store", None)
+        if store is None:
+            self._audio = pypianoroll.load(self.file_struct.audio_file)
+        else:
+            if "multitrack" not in store:
+                store["multitrack"] = pypianoroll.load(
+                    self.file_struct.audio_file)
+            self._audio = copy.deepcopy(store["multitrack"])
 
         # Get duration (in time step) of the multitrack
         num_timestep = self._audio.tracks[0].pianoroll.shape[0]
@@ -52,6 +52,9 @@ AddConfigVar('dataset.features_ext', "Extension for the features files.",
              StrParam(".json"))
 AddConfigVar('dataset.references_ext', "Extension for the reference files.",
              StrParam(".jams"))
+AddConfigVar('dataset.manifest_file', "Completion manifest of the "
+             "collection runs, in the estimations directory.",
+             StrParam(".msaf_manifest.jsonl"))
 
 
 # CQT Features
@@ -8,7 +8,6 @@ ground truth (human annotated data).
     process
 """
 import jams
-from joblib import Parallel, delayed
 import logging
 import mir_eval
 import numpy as np
@@ -20,6 +19,7 @@ import six
 import msaf
 from msaf.exceptions import NoReferencesError
 import msaf.input_output as io
+from msaf import scheduler
 from msaf import utils
 
 
@@ -300,7 +300,8 @@ def get_results_file_name(boundaries_id, labels_id, config,
 def process(in_path, boundaries_id=msaf.config.default_bound_id,
             labels_id=msaf.config.default_label_id, annot_beats=False,
             framesync=False, feature="pcp", hier=False, save=False,
-            out_file=None, n_jobs=4, annotator_id=0, config=None):
+            out_file=None, n_jobs=4, annotator_id=0, config=None,
+            stats=None):
     """Main process to evaluate algorithms' results.
 
     Parameters
@@ -335,6 +336,9 @@ def process(in_path, boundaries_id=msaf.config.default_bound_id,
     config: dict
         Dictionary containing custom configuration parameters for the
         algorithms.  If None, the default parameters are used.
+    stats: dict
+        If given, it is filled with the core utilization of the processes
+        in collection mode (see `msaf.scheduler.map_tracks`).
 
     Return
     ------
@@ -376,11 +380,24 @@ def process(in_path, boundaries_id=msaf.config.default_bound_id,
         # Get files
         file_structs = io.get_dataset_files(in_path)
 
-        # Evaluate in parallel
+        # Evaluate in parallel, longest tracks first
         logging.info("Evaluating %d tracks..." % len(file_structs))
-        evals = Parallel(n_jobs=n_jobs)(delayed(process_track)(
-            file_struct, boundaries_id, labels_id, config,
-            annotator_id=annotator_id) for file_struct in file_structs[:])
+        track_evals = {}
+        for file_struct, res, error in scheduler.map_tracks(
+                process_track, file_structs,
+                args=(boundaries_id, labels_id, config),
+                kwargs=dict(annotator_id=annotator_id), n_jobs=n_jobs,
+                stats=stats):
+            if error is None:
+                track_evals[file_struct.audio_file] = res
+            else:
+                logging.error("Could not evaluate %s:\n%s" %
+                              (file_struct.audio_file, error))
+
+        # Keep the order of the dataset
+        evals = [track_evals[file_struct.audio_file]
+                 for file_struct in file_structs
+                 if file_struct.audio_file in track_evals]
 
     # Aggregate evaluations in pandas format
     results = pd.DataFrame()
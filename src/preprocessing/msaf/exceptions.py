@@ -54,3 +54,8 @@ class NoEstimationsError(MSAFError):
 class WrongAlgorithmID(MSAFError):
     '''This algorithm was not found in msaf'''
     pass
+
+
+class SegmentationServiceError(MSAFError):
+    '''Exception class for failed requests to the segmentation service'''
+    pass
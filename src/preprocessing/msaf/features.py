@@ -107,7 +107,7 @@ class CQT(Features):
             flattened = np.concatenate(pianorolls, axis=1).astype(float)
         elif self.mode == 'merge':
             flattened = self._audio.get_merged_pianoroll().astype(float)
-        flattened += self.epsilon * np.random.normal(size=flattened.shape)
+        flattened += self.epsilon * self._rng.normal(size=flattened.shape)
         if self.norm:
             flattened = get_normalized(flattened)
         flattened = librosa.amplitude_to_db(flattened, ref=self.ref_power)
@@ -184,7 +184,7 @@ class MFCC(Features):
             flattened = np.concatenate(pianorolls, axis=1).astype(float)
         elif self.mode == 'merge':
             flattened = self._audio.get_merged_pianoroll().astype(float)
-        flattened += self.epsilon * np.random.normal(size=flattened.shape)
+        flattened += self.epsilon * self._rng.normal(size=flattened.shape)
         if self.norm:
             flattened = get_normalized(flattened)
         flattened = librosa.amplitude_to_db(flattened, ref=self.ref_power)
@@ -262,7 +262,7 @@ class PCP(Features):
         elif self.mode == 'merge':
             flattened = to_chroma(self._audio.get_merged_pianoroll())
             flattened = flattened.astype(float)
-        flattened += self.epsilon * np.random.normal(size=flattened.shape)
+        flattened += self.epsilon * self._rng.normal(size=flattened.shape)
         if self.norm:
             flattened = get_normalized(flattened)
         flattened = librosa.amplitude_to_db(flattened, ref=self.ref_power)
@@ -10,22 +10,27 @@ import os
 import re
 from collections import defaultdict
 
-import jams
 import numpy as np
 import six
 
 # Local stuff
 import msaf
 from msaf import utils
-from msaf.exceptions import NoEstimationsError
+from msaf.exceptions import NoEstimationsError, NoFeaturesFileError
 
 # Put dataset config in a global var
 ds_config = msaf.config.dataset
 
 
 class FileStruct:
-    def __init__(self, audio_file):
-        """Creates the entire file structure given the audio file."""
+    def __init__(self, audio_file, in_memory=False):
+        """Creates the entire file structure given the audio file.
+
+        If `in_memory`, the features are not read from or written to a
+        features file, but kept in the `features_store` dictionary of this
+        object, so they are computed once and shared by all the features
+        and algorithms that use this file structure.
+        """
         self.ds_path = os.path.dirname(os.path.dirname(audio_file))
         self.audio_file = audio_file
         self.est_file = self._get_dataset_file(ds_config.estimations_dir,
@@ -34,6 +39,10 @@ class FileStruct:
                                                     ds_config.features_ext)
         self.ref_file = self._get_dataset_file(ds_config.references_dir,
                                                ds_config.references_ext)
+        self.features_store = None
+        if in_memory:
+            self.features_file = None
+            self.features_store = {}
 
     def _get_dataset_file(self, dir, ext):
         """Gets the desired dataset file."""
@@ -73,6 +82,7 @@ def read_estimations(est_file, boundaries_id, labels_id=None, **params):
         Array containing the estimated labels.
         Empty array if labels_id is None.
     """
+    import jams
     # Open file and read jams
     jam = jams.load(est_file)
 
@@ -120,6 +130,7 @@ def read_references(audio_path, annotator_id=0):
     ------
     IOError: if `audio_path` doesn't exist.
     """
+    import jams
     # Dataset path
     ds_path = os.path.dirname(os.path.dirname(audio_path))
 
@@ -230,12 +241,50 @@ def save_estimations(file_struct, times, labels, boundaries_id, labels_id,
     params : dict
         Dictionary with additional parameters for both algorithms.
     """
+    save_estimations_batch(
+        file_struct, [(times, labels, boundaries_id, labels_id, params)])
+
+
+def save_estimations_batch(file_struct, estimations):
+    """Saves multiple segment estimations of the same track in its JAMS
+    file, reading and writing the file only once.
+
+    Parameters
+    ----------
+    file_struct : FileStruct
+        Object with the different file paths of the current file.
+    estimations : list
+        Tuples of (times, labels, boundaries_id, labels_id, params) of each
+        estimation (see `save_estimations`).
+    """
+    import jams
+    # Find the estimations in the existing file, or create a new one
+    if os.path.isfile(file_struct.est_file):
+        jam = jams.load(file_struct.est_file, validate=False)
+    else:
+        jam = jams.JAMS()
+        if file_struct.features_file is None:
+            dur = get_store_duration(file_struct.features_store)
+        else:
+            dur = get_duration(file_struct.features_file)
+        jam.file_metadata.duration = dur
+
+    for times, labels, boundaries_id, labels_id, params in estimations:
+        _add_estimation(jam, times, labels, boundaries_id, labels_id,
+                        dict(params))
+
+    # Write results
+    jam.save(file_struct.est_file)
+
+
+def _add_estimation(jam, times, labels, boundaries_id, labels_id, params):
+    """Adds a segment estimation to the JAMS object, overwriting the
+    existing estimation with the same parameters (see `save_estimations`).
+    """
+    import jams
     # Remove features if they exist
     params.pop("features", None)
 
-    # Get duration
-    dur = get_duration(file_struct.features_file)
-
     # Convert to intervals and sanity check
     if 'numpy' in str(type(times)):
         # Flat check
@@ -261,18 +310,11 @@ def save_estimations(file_struct, times, labels, boundaries_id, labels_id,
     ann = jams.Annotation(namespace=namespace)
 
     # Find estimation in file
-    if os.path.isfile(file_struct.est_file):
-        jam = jams.load(file_struct.est_file, validate=False)
-        curr_ann = find_estimation(jam, boundaries_id, labels_id, params)
-        if curr_ann is not None:
-            curr_ann.data = ann.data  # cleanup all data
-            ann = curr_ann  # This will overwrite the existing estimation
-        else:
-            jam.annotations.append(ann)
+    curr_ann = find_estimation(jam, boundaries_id, labels_id, params)
+    if curr_ann is not None:
+        curr_ann.data = ann.data  # cleanup all data
+        ann = curr_ann  # This will overwrite the existing estimation
     else:
-        # Create new JAMS if it doesn't exist
-        jam = jams.JAMS()
-        jam.file_metadata.duration = dur
         jam.annotations.append(ann)
 
     # Save metadata and parameters
@@ -299,9 +341,6 @@ def save_estimations(file_struct, times, labels, boundaries_id, labels_id,
             ann.append(time=bound_inter[0], duration=dur,
                        value=value)
 
-    # Write results
-    jam.save(file_struct.est_file)
-
 
 def get_all_boundary_algorithms():
     """Gets all the possible boundary algorithms in MSAF.
@@ -311,12 +350,7 @@ def get_all_boundary_algorithms():
     algo_ids : list
         List of all the IDs of boundary algorithms (strings).
     """
-    algo_ids = []
-    for name in msaf.algorithms.__all__:
-        module = eval(msaf.algorithms.__name__ + "." + name)
-        if module.is_boundary_type:
-            algo_ids.append(module.algo_id)
-    return algo_ids
+    return msaf.algorithms.get_boundary_algorithms()
 
 
 def get_all_label_algorithms():
@@ -327,12 +361,7 @@ def get_all_label_algorithms():
     algo_ids : list
         List of all the IDs of label algorithms (strings).
     """
-    algo_ids = []
-    for name in msaf.algorithms.__all__:
-        module = eval(msaf.algorithms.__name__ + "." + name)
-        if module.is_label_type:
-            algo_ids.append(module.algo_id)
-    return algo_ids
+    return msaf.algorithms.get_label_algorithms()
 
 
 def get_configuration(feature, annot_beats, framesync, boundaries_id,
@@ -345,12 +374,10 @@ def get_configuration(feature, annot_beats, framesync, boundaries_id,
     config["framesync"] = framesync
     bound_config = {}
     if boundaries_id != "gt":
-        bound_config = \
-            eval(msaf.algorithms.__name__ + "." + boundaries_id).config
+        bound_config = msaf.algorithms.get_algorithm(boundaries_id).config
         config.update(bound_config)
     if labels_id is not None:
-        label_config = \
-            eval(msaf.algorithms.__name__ + "." + labels_id).config
+        label_config = msaf.algorithms.get_algorithm(labels_id).config
 
         # Make sure we don't have parameter name duplicates
         if labels_id != boundaries_id:
@@ -388,6 +415,49 @@ def get_dataset_files(in_path):
     return file_structs
 
 
+def get_manifest_file(in_path):
+    """Gets the completion manifest file of the given dataset."""
+    return os.path.join(in_path, ds_config.estimations_dir,
+                        ds_config.manifest_file)
+
+
+def read_manifest(manifest_file):
+    """Reads the completion manifest of the collection runs.
+
+    The manifest is a JSON lines file with one entry per processed track,
+    appended as the tracks finish. When a track is processed more than once,
+    the last entry wins.
+
+    Parameters
+    ----------
+    manifest_file : str
+        Path to the manifest file.
+
+    Returns
+    -------
+    entries : dict
+        Last entry of each (run key, audio file) pair.
+    """
+    entries = {}
+    if not os.path.isfile(manifest_file):
+        return entries
+    with open(manifest_file) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Partially written line (e.g., the run was killed)
+                continue
+            entries[(entry["run"], entry["track"])] = entry
+    return entries
+
+
+def append_manifest(manifest_file, entry):
+    """Appends an entry to the completion manifest of the collection runs."""
+    with open(manifest_file, "a") as f:
+        f.write(json.dumps(entry, sort_keys=True) + "\n")
+
+
 def read_hier_references(jams_file, annotation_id=0, exclude_levels=[]):
     """Reads hierarchical references from a jams file.
 
@@ -409,6 +479,7 @@ def read_hier_references(jams_file, annotation_id=0, exclude_levels=[]):
     hier_levels : list
         List of strings for the level identifiers.
     """
+    import jams
     hier_bounds = []
     hier_labels = []
     hier_levels = []
@@ -452,6 +523,27 @@ def get_duration(features_file):
     return float(feats["globals"]["dur"])
 
 
+def get_store_duration(features_store):
+    """Reads the duration of a track from the in-memory features store of
+    its file structure (see `FileStruct`).
+
+    Parameters
+    ----------
+    features_store: dict
+        Features of the track, keyed by their type and parameters.
+
+    Returns
+    -------
+    dur: float
+        Duration of the analyzed file.
+    """
+    for key, feats in six.iteritems(features_store or {}):
+        if key != "multitrack" and feats.get("dur") is not None:
+            return float(feats["dur"])
+    raise NoFeaturesFileError("No features have been computed in memory "
+                              "for this track yet.")
+
+
 def write_mirex(times, labels, out_file):
     """Writes results to file using the standard MIREX format.
 
@@ -41,3 +41,5 @@ from .sivm_search import *
 from .sivm_gsat import *
 
 from .gmap import *
+
+from .batch import *
@@ -7,6 +7,7 @@
 PyMF Archetypal Analysis [1]
 
     AA: class for Archetypal Analysis
+    simplex_lstsq: least squares with columns restricted to the simplex
 
 [1] Cutler, A. Breiman, L. (1994), "Archetypal Analysis", Technometrics 36(4),
 338-347.
@@ -15,12 +16,87 @@ PyMF Archetypal Analysis [1]
 
 import numpy as np
 from .dist import vq
-from cvxopt import solvers, base
 
 from .svd import pinv
 from .nmf import NMF
 
-__all__ = ["AA"]
+__all__ = ["AA", "simplex_lstsq"]
+
+
+def _project_simplex(V):
+    """ Euclidean projection of each column of V onto the probability simplex
+    {x : x >= 0, sum(x) = 1} (sort-based, see Duchi et al. 2008) """
+    k, n = V.shape
+    U = -np.sort(-V, axis=0)
+    css = np.cumsum(U, axis=0) - 1.0
+    ind = np.arange(1, k + 1)[:, np.newaxis]
+
+    # number of positive entries of each projection (the first row always
+    # satisfies the condition)
+    rho = k - np.argmax((U - css/ind > 0)[::-1], axis=0)
+    theta = css[rho - 1, np.arange(n)]/rho
+    return np.maximum(V - theta, 0.0)
+
+
+def simplex_lstsq(A, B, X=None, niter=100, tol=1e-6):
+    """ Solve min | B - A*X | s.t. each column of X lies on the simplex
+    (X >= 0, sum(X, axis=0) = [1 .. 1]), for all the columns at once.
+
+    Uses accelerated projected gradient descent (FISTA) with a step size
+    given by the largest eigenvalue of A^T A.
+
+    Parameters
+    ----------
+    A : array_like, shape (m, k)
+    B : array_like, shape (m, n)
+    X : array_like, shape (k, n), optional
+        initial solution (warm start); projected onto the simplex first.
+    niter : int
+        maximal number of iterations.
+    tol : float
+        stop when no coefficient changes by more than tol.
+
+    Returns
+    -------
+    X : array, shape (k, n)
+    """
+    m, k = A.shape
+    if X is None:
+        X = np.ones((k, B.shape[1]))/k
+    else:
+        X = _project_simplex(np.array(X, dtype=np.float64))
+
+    # the gradient A^T (A*X - B) is computed through the smaller of the
+    # two Gram matrices
+    if m >= k:
+        AtA = np.dot(A.T, A)
+        AtB = np.dot(A.T, B)
+        L = np.linalg.eigvalsh(AtA)[-1]
+
+        def grad(Y):
+            return np.dot(AtA, Y) - AtB
+    else:
+        L = np.linalg.eigvalsh(np.dot(A, A.T))[-1]
+
+        def grad(Y):
+            return np.dot(A.T, np.dot(A, Y) - B)
+
+    if L <= 0:
+        return X
+
+    Y = X
+    t = 1.0
+    for i in range(niter):
+        X_new = _project_simplex(Y - grad(Y)/L)
+        t_new = (1.0 + np.sqrt(1.0 + 4.0*t**2))/2.0
+        Y = X_new + ((t - 1.0)/t_new)*(X_new - X)
+        change = np.abs(X_new - X).max()
+        X, t = X_new, t_new
+        if change < tol:
+            break
+
+    return X
+
 
 class AA(NMF):
     """
@@ -29,8 +105,9 @@ class AA(NMF):
     Archetypal Analysis. Factorize a data matrix into two matrices s.t.
     F = | data - W*H | = | data - data*beta*H| is minimal. H and beta
     are restricted to convexity (beta >=0, sum(beta, axis=1) = [1 .. 1]).
-    Factorization is solved via an alternating least squares optimization
-    using the quadratic programming solver from cvxopt.
+    Factorization is solved via an alternating least squares optimization,
+    where each step is a simplex-constrained least squares problem solved for
+    all columns at once (see simplex_lstsq).
 
     Parameters
     ----------
@@ -77,8 +154,11 @@ class AA(NMF):
 
     The result is a set of coefficients aa_mdl.H, s.t. data = W * aa_mdl.H.
     """
-    # set cvxopt options
-    solvers.options['show_progress'] = False
+    # iterations of the simplex-constrained least squares in each step
+    _SOLVER_NITER = 100
+
+    # stop when the error changes by less than this fraction
+    _RTOL = 1e-6
 
     def init_h(self):
         self.H = np.random.random((self._num_bases, self._num_samples))
@@ -93,43 +173,20 @@ class AA(NMF):
     def update_h(self):
         """ alternating least squares step, update H under the convexity
         constraint """
-        def update_single_h(i):
-            """ compute single H[:,i] """
-            # optimize alpha using qp solver from cvxopt
-            FA = base.matrix(np.float64(np.dot(-self.W.T, self.data[:,i])))
-            al = solvers.qp(HA, FA, INQa, INQb, EQa, EQb)
-            self.H[:,i] = np.array(al['x']).reshape((1, self._num_bases))
-
-        EQb = base.matrix(1.0, (1,1))
-        # float64 required for cvxopt
-        HA = base.matrix(np.float64(np.dot(self.W.T, self.W)))
-        INQa = base.matrix(-np.eye(self._num_bases))
-        INQb = base.matrix(0.0, (self._num_bases,1))
-        EQa = base.matrix(1.0, (1, self._num_bases))
-
-        for i in range(self._num_samples):
-            update_single_h(i)
+        # warm start from the previous coefficients
+        self.H = simplex_lstsq(self.W, self.data[:,:], X=self.H,
+                               niter=self._SOLVER_NITER)
 
     def update_w(self):
         """ alternating least squares step, update W under the convexity
         constraint """
-        def update_single_w(i):
-            """ compute single W[:,i] """
-            # optimize beta     using qp solver from cvxopt
-            FB = base.matrix(np.float64(np.dot(-self.data.T, W_hat[:,i])))
-            be = solvers.qp(HB, FB, INQa, INQb, EQa, EQb)
-            self.beta[i,:] = np.array(be['x']).reshape((1, self._num_samples))
-
-        # float64 required for cvxopt
-        HB = base.matrix(np.float64(np.dot(self.data[:,:].T, self.data[:,:])))
-        EQb = base.matrix(1.0, (1, 1))
+        # rows of beta are convex combinations of the samples that best
+        # approximate W_hat = data * pinv(H)
         W_hat = np.dot(self.data, pinv(self.H))
-        INQa = base.matrix(-np.eye(self._num_samples))
-        INQb = base.matrix(0.0, (self._num_samples, 1))
-        EQa = base.matrix(1.0, (1, self._num_samples))
-
-        for i in range(self._num_bases):
-            update_single_w(i)
+        if not hasattr(self, 'beta'):
+            self.beta = np.ones((self._num_bases, self._num_samples))
+        self.beta = simplex_lstsq(self.data[:,:], W_hat, X=self.beta.T,
+                                  niter=self._SOLVER_NITER).T
 
         self.W = np.dot(self.beta, self.data.T).T
 
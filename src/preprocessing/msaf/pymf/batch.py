@@ -0,0 +1,374 @@
+#!/usr/bin/python
+"""
+PyMF batched factorizations of many small, same-rank problems.
+
+    BatchNMF : Class for batched Non-negative Matrix Factorization
+    BatchCNMF : Class for batched Convex Matrix Factorization
+
+The data matrices of all problems are zero-padded to a common shape and
+stacked, so each multiplicative update is a single batched matmul over all
+of them. Zero padding is exact: padded samples (and dimensions) get zero
+coefficients and do not change the factorization of the actual data.
+Problems that converge are dropped from the stack, so the rest keep
+iterating on a smaller batch. The problems can also have different ranks:
+the bases beyond the rank of a problem are zero, and the multiplicative
+updates keep them at zero.
+"""
+
+
+import numpy as np
+import logging
+
+from .nmf import NMF
+from .cnmf import CNMF
+from .kmeans import Kmeans
+
+
+__all__ = ["BatchNMF", "BatchCNMF"]
+
+
+def _transpose(A):
+    return np.swapaxes(A, 1, 2)
+
+
+class BatchNMF(NMF):
+    """
+    BatchNMF(data, num_bases=4)
+
+    Batched Non-negative Matrix Factorization. Factorizes each data matrix
+    data[b] s.t. | data[b] - W[b]*H[b] | is minimal, using the classical
+    multiplicative update rule of NMF for all of them at once.
+
+    Parameters
+    ----------
+    data : list of array_like, shape (_data_dimension_b, _num_samples_b)
+        the input data matrices (they can have different shapes)
+    num_bases: int or list of int, optional
+        Number of bases to compute (column rank of W and row rank of H),
+        for all the problems or for each of them. 4 (default)
+
+    Attributes
+    ----------
+    W : list of "data_dimension_b x num_bases_b" matrices of basis vectors
+    H : list of "num bases_b x num_samples_b" matrices of coefficients
+    ferr : list of frobenius norms for each problem (after .factorize())
+
+    Example
+    -------
+    >>> import numpy as np
+    >>> data = [np.array([[1.0, 0.0, 2.0], [0.0, 1.0, 1.0]]),
+    ...         np.array([[1.0, 0.5], [0.0, 1.0]])]
+    >>> nmf_mdl = BatchNMF(data, num_bases=2)
+    >>> nmf_mdl.factorize(niter=10)
+    """
+
+    def __init__(self, data, num_bases=4):
+        if np.ndim(num_bases) == 0:
+            num_bases = [num_bases]*len(data)
+        self._ranks = [int(r) for r in num_bases]
+        NMF.__init__(self, np.empty((0, 0)),
+                     num_bases=max(self._ranks + [0]))
+
+        self._shapes = [np.shape(X) for X in data]
+        self._num_problems = len(data)
+        self._data_dimension = max([s[0] for s in self._shapes] + [0])
+        self._num_samples = max([s[1] for s in self._shapes] + [0])
+
+        # zero-padded stack of the data matrices, and mask of valid samples
+        self.data = np.zeros((self._num_problems, self._data_dimension,
+                              self._num_samples))
+        self._mask = np.zeros((self._num_problems, self._num_samples))
+        for b, X in enumerate(data):
+            d, n = self._shapes[b]
+            self.data[b, :d, :n] = X[:, :]
+            self._mask[b, :n] = 1.0
+
+    # stacked arrays that are iterated on (only for the active problems),
+    # and the factors among them
+    _state = ['_X', '_X_sqnorm', '_W', '_H']
+    _factors = ['_W', '_H']
+
+    def init_w(self):
+        self._W = np.random.random((self._num_problems, self._data_dimension,
+                                    self._num_bases))
+        for b, (d, n) in enumerate(self._shapes):
+            self._W[b, d:, :] = 0.0
+            self._W[b, :, self._ranks[b]:] = 0.0
+
+    def init_h(self):
+        self._H = np.random.random((self._num_problems, self._num_bases,
+                                    self._num_samples))
+        self._H *= self._mask[:, np.newaxis, :]
+        for b, r in enumerate(self._ranks):
+            self._H[b, r:, :] = 0.0
+
+    def _init_state(self):
+        self._X = self.data
+        # squared norm of each data matrix (constant while iterating)
+        self._X_sqnorm = np.sum(self._X**2, axis=(1, 2))
+
+    def _update(self, compute_w, compute_h):
+        """Multiplicative updates of all the active problems. Returns the
+        squared errors of the updated factorizations."""
+        X, W, H = self._X, self._W, self._H
+
+        if compute_w:
+            W2 = np.matmul(W, np.matmul(H, _transpose(H))) + 10**-9
+            W *= np.matmul(X, _transpose(H))
+            W /= W2
+
+        WtW = np.matmul(_transpose(W), W)
+        WtX = np.matmul(_transpose(W), X)
+        if compute_h:
+            H2 = np.matmul(WtW, H) + 10**-9
+            H *= WtX
+            H /= H2
+
+        # trace identity, see NMF.fast_frobenius_norm()
+        HHt = np.matmul(H, _transpose(H))
+        return self._X_sqnorm - 2.0*np.sum(WtX*H, axis=(1, 2)) + \
+            np.sum(WtW*HHt, axis=(1, 2))
+
+    def _retire(self, results, active, done):
+        """Stores the factors of the problems that are done and removes them
+        from the stacked arrays (the only copy made while iterating)."""
+        for name in self._factors:
+            results[name][active[done]] = getattr(self, name)[done]
+        for name in self._state:
+            setattr(self, name, getattr(self, name)[~done])
+
+    def _finalize(self):
+        self.W = [self._W[b, :d, :r]
+                  for b, ((d, n), r) in enumerate(zip(self._shapes, self._ranks))]
+        self.H = [self._H[b, :r, :n]
+                  for b, ((d, n), r) in enumerate(zip(self._shapes, self._ranks))]
+
+    def factorize(self, niter=10, compute_w=True, compute_h=True,
+                  compute_err=True, show_progress=False, err_every=1,
+                  rtol=None):
+        """ Factorize s.t. W[b]H[b] = data[b] for all the problems
+
+            Parameters
+            ----------
+            niter : int
+                    number of iterations.
+            show_progress : bool
+                    print some extra information to stdout.
+            compute_h : bool
+                    iteratively update values for H.
+            compute_w : bool
+                    iteratively update values for W.
+            compute_err : bool
+                    compute the Frobenius norms |data[b]-W[b]H[b]|, stop
+                    iterating on the problems that have converged, and store
+                    them to .ferr[b].
+            err_every : int
+                    only check for convergence every err_every iterations.
+            rtol : float
+                    stop iterating on a problem when the relative change of
+                    its error is below rtol (default: the _RTOL of the class,
+                    see NMF.converged()).
+
+            Updated Values
+            --------------
+            .W : updated values for W.
+            .H : updated values for H.
+            .ferr : Frobenius norms |data[b]-W[b]H[b]| for each problem.
+        """
+
+        if show_progress:
+            self._logger.setLevel(logging.INFO)
+        else:
+            self._logger.setLevel(logging.ERROR)
+
+        if not hasattr(self, '_W'):
+            self.init_w()
+
+        if not hasattr(self, '_H'):
+            self.init_h()
+
+        self._rtol = self._RTOL if rtol is None else rtol
+
+        self._init_state()
+        results = dict((name, np.copy(getattr(self, name)))
+                       for name in self._factors)
+        num_samples = np.array([s[1] for s in self._shapes], dtype=float)
+        ferr = [[] for _ in range(self._num_problems)]
+        active = np.arange(self._num_problems)
+
+        for i in range(niter):
+            if len(active) == 0:
+                break
+
+            err = np.sqrt(np.maximum(self._update(compute_w, compute_h), 0.0))
+
+            if not compute_err or (i+1) % err_every != 0:
+                self._logger.info('Iteration ' + str(i+1) + '/' + str(niter))
+                continue
+
+            # same test as NMF.converged() for each problem
+            done = np.zeros(len(active), dtype=bool)
+            for j, b in enumerate(active):
+                ferr[b].append(err[j])
+                k = len(ferr[b]) - 1
+                if k > 1:
+                    derr = np.abs(ferr[b][k] - ferr[b][k-1])
+                    if self._rtol is not None:
+                        done[j] = derr <= self._rtol*np.abs(ferr[b][k-1])
+                    else:
+                        done[j] = derr/num_samples[b] < self._EPS
+                    if done[j]:
+                        # as NMF.factorize(), the last error is not kept
+                        ferr[b].pop()
+
+            self._logger.info('Iteration ' + str(i+1) + '/' + str(niter) +
+                              ' active problems:' + str(len(active)))
+
+            # stop iterating on the converged problems
+            if done.any():
+                self._retire(results, active, done)
+                active = active[~done]
+
+        # store the problems that were still active
+        self._retire(results, active, np.ones(len(active), dtype=bool))
+        for name in self._factors:
+            setattr(self, name, results[name])
+
+        self.ferr = [np.asarray(e) for e in ferr]
+        self._finalize()
+
+
+class BatchCNMF(BatchNMF):
+    """
+    BatchCNMF(data, num_bases=4)
+
+    Batched Convex NMF. Factorizes each data matrix data[b] s.t.
+    | data[b] - data[b]*G[b]*H[b] | is minimal, with the same updates and
+    stopping criterion as pymf.CNMF, for all of them at once. Each problem
+    is initialized with k-means, as in pymf.CNMF, in the order of the
+    problems.
+
+    Parameters
+    ----------
+    data : list of array_like, shape (_data_dimension_b, _num_samples_b)
+        the input data matrices (they can have different shapes)
+    num_bases: int or list of int, optional
+        Number of bases to compute (column rank of W and row rank of H),
+        for all the problems or for each of them. 4 (default)
+
+    Attributes
+    ----------
+    W : list of "data_dimension_b x num_bases_b" matrices of basis vectors
+    G : list of "num_samples_b x num_bases_b" convex weights (W = data*G)
+    H : list of "num bases_b x num_samples_b" matrices of coefficients
+    ferr : list of frobenius norms for each problem (after .factorize())
+
+    Example
+    -------
+    >>> import numpy as np
+    >>> data = [np.array([[1.0, 0.0, 2.0], [0.0, 1.0, 1.0]]),
+    ...         np.array([[1.0, 0.5, 0.0], [0.0, 1.0, 0.2]])]
+    >>> cnmf_mdl = BatchCNMF(data, num_bases=2)
+    >>> cnmf_mdl.factorize(niter=10)
+
+    Each problem gets the same factorization as with pymf.CNMF under the
+    same seed, and stops at the same iteration:
+
+    >>> rng = np.random.RandomState(0)
+    >>> data = [rng.rand(6, 40), rng.rand(6, 25)]
+    >>> np.random.seed(0)
+    >>> single_mdls = [CNMF(X, num_bases=r) for X, r in zip(data, [3, 2])]
+    >>> for mdl in single_mdls:
+    ...     mdl.factorize(niter=500)
+    >>> np.random.seed(0)
+    >>> batch_mdl = BatchCNMF(data, num_bases=[3, 2])
+    >>> batch_mdl.factorize(niter=500)
+    >>> ([len(mdl.ferr) for mdl in single_mdls] ==
+    ...  [len(ferr) for ferr in batch_mdl.ferr])
+    True
+    >>> all(np.allclose(mdl.H, H) and np.allclose(mdl.G, G)
+    ...     for mdl, H, G in zip(single_mdls, batch_mdl.H, batch_mdl.G))
+    True
+    """
+
+    # same stopping criterion as pymf.CNMF
+    _RTOL = CNMF._RTOL
+
+    def init_w(self):
+        pass
+
+    def init_h(self):
+        # initialize each problem using k-means, as pymf.CNMF
+        self._H = np.zeros((self._num_problems, self._num_bases,
+                            self._num_samples))
+        self._G = np.zeros((self._num_problems, self._num_samples,
+                            self._num_bases))
+        for b, ((d, n), r) in enumerate(zip(self._shapes, self._ranks)):
+            km = Kmeans(self.data[b, :d, :n], num_bases=r)
+            km.factorize(niter=10)
+            assign = km.assigned
+            num_i = np.bincount(assign, minlength=r)
+
+            self._H[b, assign, np.arange(n)] = 1.0
+            self._H[b, :r, :n] += 0.2
+
+            self._G[b, np.arange(n), assign] = 1.0
+            self._G[b, :n, :r] += 0.01
+            self._G[b, :n] /= num_i[assign][:, np.newaxis]
+
+    _state = ['_XtX_pos', '_XtX_neg', '_XtX_trace', '_G', '_H']
+    _factors = ['_G', '_H']
+
+    def _init_state(self):
+        # the Gram matrices replace the data in the updates
+        XtX = np.matmul(_transpose(self.data), self.data)
+        self._XtX_pos = (np.abs(XtX) + XtX)/2.0
+        self._XtX_neg = (np.abs(XtX) - XtX)/2.0
+        self._XtX_trace = np.trace(XtX, axis1=1, axis2=2)
+
+    def _update(self, compute_w, compute_h):
+        XtX_pos, XtX_neg = self._XtX_pos, self._XtX_neg
+        G, H = self._G, self._H
+        Gt = _transpose(G)
+
+        XtX_neg_x_W = np.matmul(XtX_neg, G)
+        XtX_pos_x_W = np.matmul(XtX_pos, G)
+
+        # update H (H^T G^T XtX G is evaluated as H^T (G^T XtX G))
+        if compute_h:
+            Ht = _transpose(H)
+            ha = XtX_pos_x_W + np.matmul(Ht, np.matmul(Gt, XtX_neg_x_W))
+            hb = XtX_neg_x_W + np.matmul(Ht, np.matmul(Gt, XtX_pos_x_W)) + \
+                10**-9
+            H *= _transpose(np.sqrt(ha/hb))
+
+        # update G
+        HT_x_H = np.matmul(H, _transpose(H))
+        if compute_w:
+            Ht = _transpose(H)
+            wa = np.matmul(XtX_pos, Ht) + np.matmul(XtX_neg_x_W, HT_x_H)
+            wb = np.matmul(XtX_neg, Ht) + np.matmul(XtX_pos_x_W, HT_x_H) + \
+                10**-9
+            G *= np.sqrt(wa/wb)
+            XtX_neg_x_W = np.matmul(XtX_neg, G)
+            XtX_pos_x_W = np.matmul(XtX_pos, G)
+
+        # trace identity, see CNMF._trace_frobenius_norm()
+        XtX_x_G = XtX_pos_x_W - XtX_neg_x_W
+        return self._XtX_trace - \
+            2.0*np.sum(XtX_x_G*_transpose(H), axis=(1, 2)) + \
+            np.sum(np.matmul(_transpose(G), XtX_x_G)*HT_x_H, axis=(1, 2))
+
+    def _finalize(self):
+        del self._XtX_pos, self._XtX_neg, self._XtX_trace
+        self.G = [self._G[b, :n, :r]
+                  for b, ((d, n), r) in enumerate(zip(self._shapes, self._ranks))]
+        self.H = [self._H[b, :r, :n]
+                  for b, ((d, n), r) in enumerate(zip(self._shapes, self._ranks))]
+        self.W = [np.dot(self.data[b, :d, :n], G)
+                  for b, ((d, n), G) in enumerate(zip(self._shapes, self.G))]
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -66,8 +66,8 @@ class CHNMF(AA):
     Convex Hull Non-negative Matrix Factorization. Factorize a data matrix into
     two matrices s.t. F = | data - W*H | is minimal. H is restricted to convexity
     (H >=0, sum(H, axis=1) = [1 .. 1]) and W resides on actual data points.
-    Factorization is solved via an alternating least squares optimization using
-    the quadratic programming solver from cvxopt. The results are usually
+    Factorization is solved via an alternating least squares optimization with
+    a simplex-constrained least squares solver. The results are usually
     equivalent to Archetypal Analysis (pymf.AA) but CHNMF also works for very
     large datasets.
 
@@ -19,7 +19,21 @@ from .nmf import NMF
 from .kmeans import Kmeans
 
 
-__all__ = ["CNMF"]
+__all__ = ["CNMF", "gram_matrices"]
+
+
+def gram_matrices(data):
+    """ Gram matrix of the data and its positive and negative parts, as used
+    by the CNMF updates. They only depend on the data, so they can be shared
+    by several factorizations of the same data (e.g. with different ranks).
+
+    Returns:
+        (XtX, XtX_pos, XtX_neg)
+    """
+    XtX = np.dot(data[:,:].T, data[:,:])
+    XtX_pos = (np.abs(XtX) + XtX)/2.0
+    XtX_neg = (np.abs(XtX) - XtX)/2.0
+    return XtX, XtX_pos, XtX_neg
 
 class CNMF(NMF):
     """
@@ -37,6 +51,9 @@ class CNMF(NMF):
     num_bases: int, optional
         Number of bases to compute (column rank of W and row rank of H).
         4 (default)
+    gram: tuple, optional
+        Precomputed gram_matrices(data), e.g. shared with another CNMF of
+        the same data. None (default) computes them in .factorize().
 
     Attributes
     ----------
@@ -67,6 +84,14 @@ class CNMF(NMF):
     The result is a set of coefficients acnmf_mdl.H, s.t. data = W * cnmf_mdl.H.
     """
 
+    # stop when the error changes by less than this fraction (the C-NMF
+    # updates decrease it slowly but steadily once close to convergence)
+    _RTOL = 1e-6
+
+    def __init__(self, data, num_bases=4, gram=None):
+        NMF.__init__(self, data, num_bases=num_bases)
+        self.gram = gram
+
     # see .factorize() for the update of W and H
     # -> proper decoupling of W/H not possible ...
     def update_w(self):
@@ -85,9 +110,7 @@ class CNMF(NMF):
             km.factorize(niter=10)
             assign = km.assigned
 
-            num_i = np.zeros(self._num_bases)
-            for i in range(self._num_bases):
-                num_i[i] = len(np.where(assign == i)[0])
+            num_i = np.bincount(assign, minlength=self._num_bases)
 
             self.H.T[range(len(assign)), assign] = 1.0
             self.H += 0.2*np.ones((self._num_bases, self._num_samples))
@@ -106,7 +129,8 @@ class CNMF(NMF):
         pass
 
     def factorize(self, niter=10, compute_w=True, compute_h=True,
-                  compute_err=True, show_progress=False):
+                  compute_err=True, show_progress=False, err_every=1,
+                  rtol=None):
         """ Factorize s.t. WH = data
 
             Parameters
@@ -122,12 +146,18 @@ class CNMF(NMF):
             compute_err : bool
                     compute Frobenius norm |data-WH| after each update and store
                     it to .ferr[k].
+            err_every : int
+                    only compute the error (and check for convergence) every
+                    err_every iterations.
+            rtol : float
+                    stop when the relative change of the error is below rtol
+                    (default: the _RTOL of the class).
 
             Updated Values
             --------------
             .W : updated values for W.
             .H : updated values for H.
-            .ferr : Frobenius norm |data-WH| for each iteration.
+            .ferr : Frobenius norm |data-WH| for each error computation.
         """
 
         if not hasattr(self,'W'):
@@ -136,29 +166,28 @@ class CNMF(NMF):
         if not hasattr(self,'H'):
                 self.init_h()
 
-        def separate_positive(m):
-            return (np.abs(m) + m)/2.0
-
-        def separate_negative(m):
-            return (np.abs(m) - m)/2.0
-
         if show_progress:
             self._logger.setLevel(logging.INFO)
         else:
             self._logger.setLevel(logging.ERROR)
 
-        XtX = np.dot(self.data[:,:].T, self.data[:,:])
-        XtX_pos = separate_positive(XtX)
-        XtX_neg = separate_negative(XtX)
+        if self.gram is None:
+            self.gram = gram_matrices(self.data)
+        XtX, XtX_pos, XtX_neg = self.gram
 
-        self.ferr = np.zeros(niter)
-        # iterate over W and H
+        self._rtol = self._RTOL if rtol is None else rtol
 
+        if compute_err:
+            self.ferr = np.zeros(niter // err_every)
+
+        # data^T W, kept up to date with G (W = data G)
+        XtX_neg_x_W = np.dot(XtX_neg, self.G)
+        XtX_pos_x_W = np.dot(XtX_pos, self.G)
+
+        # iterate over W and H
+        k = 0
         for i in range(niter):
             # update H
-            XtX_neg_x_W = np.dot(XtX_neg, self.G)
-            XtX_pos_x_W = np.dot(XtX_pos, self.G)
-
             if compute_h:
                 H_x_WT = np.dot(self.H.T, self.G.T)
                 ha = XtX_pos_x_W + np.dot(H_x_WT, XtX_neg_x_W)
@@ -166,25 +195,45 @@ class CNMF(NMF):
                 self.H = (self.H.T*np.sqrt(ha/hb)).T
 
             # update W
+            HT_x_H = np.dot(self.H, self.H.T)
             if compute_w:
-                HT_x_H = np.dot(self.H, self.H.T)
                 wa = np.dot(XtX_pos, self.H.T) + np.dot(XtX_neg_x_W, HT_x_H)
                 wb = np.dot(XtX_neg, self.H.T) + np.dot(XtX_pos_x_W, HT_x_H) + 10**-9
 
                 self.G *= np.sqrt(wa/wb)
-                self.W = np.dot(self.data[:,:], self.G)
+                XtX_neg_x_W = np.dot(XtX_neg, self.G)
+                XtX_pos_x_W = np.dot(XtX_pos, self.G)
 
-            if compute_err:
-                self.ferr[i] = self.frobenius_norm()
+            if compute_err and (i+1) % err_every == 0:
+                self.ferr[k] = self._trace_frobenius_norm(
+                    XtX, XtX_pos_x_W - XtX_neg_x_W, HT_x_H)
                 self._logger.info('Iteration ' + str(i+1) + '/' + str(niter) +
-                ' FN:' + str(self.ferr[i]))
+                ' FN:' + str(self.ferr[k]))
+
+                if k > 1 and self.converged(k):
+                    self.ferr = self.ferr[:k]
+                    break
+                k += 1
             else:
                 self._logger.info('Iteration ' + str(i+1) + '/' + str(niter))
+        else:
+            if compute_err:
+                self.ferr = self.ferr[:k]
 
-            if i > 1 and compute_err:
-                if self.converged(i):
-                    self.ferr = self.ferr[:i]
-                    break
+        # W is only needed once the iterations are over
+        if compute_w:
+            self.W = np.dot(self.data[:,:], self.G)
+
+    def _trace_frobenius_norm(self, XtX, XtX_x_G, HT_x_H):
+        """ Frobenius norm ||data - WH|| with W = data G, from the cached
+        Gram matrix XtX, XtX_x_G = XtX G and HT_x_H = H H^T:
+
+            ||data - WH||^2 = tr(XtX) - 2 tr(H^T G^T XtX)
+                              + tr(G^T XtX G H H^T)
+        """
+        err = np.trace(XtX) - 2.0*np.sum(XtX_x_G*self.H.T) + \
+            np.sum(np.dot(self.G.T, XtX_x_G)*HT_x_H)
+        return np.sqrt(max(err, 0.0))
 
 if __name__ == "__main__":
     import doctest
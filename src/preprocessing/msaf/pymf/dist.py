@@ -18,6 +18,7 @@ PyMF several distance functions
 
 import numpy as np
 import scipy.sparse
+import scipy.special
 
 __all__ = ["abs_cosine_distance", "kl_divergence", "l1_distance", "l2_distance",
            "weighted_abs_cosine_distance","cosine_distance","vq", "pdist"]
@@ -104,27 +105,126 @@ def weighted_abs_cosine_distance(d, vec):
     ret_val = abs_cosine_distance(d, vec, weighted=True)
     return ret_val
 
-def pdist(A, B, metric='l2' ):
-    # compute pairwise distance between a data matrix A (d x n) and B (d x m).
-    # Returns a distance matrix d (n x m).
-    d = np.zeros((A.shape[1], B.shape[1]))
-    if A.shape[1] <= B.shape[1]:
-        for aidx in range(A.shape[1]):
-            if metric == 'l2':
-                d[aidx:aidx+1,:] = l2_distance(B[:,:], A[:,aidx:aidx+1]).reshape((1,-1))
-            if metric == 'l1':
-                d[aidx:aidx+1,:] = l1_distance(B[:,:], A[:,aidx:aidx+1]).reshape((1,-1))
+# Memory budget (in bytes) for the temporaries of the blocked pairwise
+# distance kernels
+MEMORY_BUDGET = 64 * 2**20
+
+def _dense(X):
+    if scipy.sparse.issparse(X):
+        return X.toarray()
+    return np.asarray(X, dtype=np.float64)
+
+def _sq_norms(X):
+    return np.einsum('ij,ij->j', X, X)
+
+def _pdist_l2(A, B, out, B_sq=None):
+    np.dot(A.T, B, out=out)
+    out *= -2.0
+    out += _sq_norms(A)[:, np.newaxis]
+    out += (_sq_norms(B) if B_sq is None else B_sq)[np.newaxis, :]
+    np.maximum(out, 0.0, out=out)
+    np.sqrt(out, out=out)
+
+def _pdist_cosine(A, B, out, B_sq=None):
+    np.dot(A.T, B, out=out)
+    k = np.sqrt(_sq_norms(A))[:, np.newaxis] * \
+        np.sqrt(_sq_norms(B) if B_sq is None else B_sq)[np.newaxis, :]
+    k += 10**-9
+    out /= k
+    np.subtract(1.0, out, out=out)
+
+def _pdist_kl(A, B, out, B_sq=None):
+    # sum(a*log(a/b) - a + b) = sum(a*log(a) - a) + sum(b) - a^T log(b),
+    # with 0*log(0) = 0, as in kl_divergence(B, a)
+    logB = np.log(np.where(B > 0, B, np.finfo(np.float64).tiny))
+    np.dot(A.T, logB, out=out)
+    out *= -1.0
+    out += (scipy.special.xlogy(A, A) - A).sum(axis=0)[:, np.newaxis]
+    out += B.sum(axis=0)[np.newaxis, :]
+
+def _pdist_l1(A, B, out, B_sq=None):
+    np.sum(np.abs(A[:, :, np.newaxis] - B[:, np.newaxis, :]), axis=0,
+           out=out)
+
+_PDIST_KERNELS = {'l2': _pdist_l2,
+                  'l1': _pdist_l1,
+                  'cosine': _pdist_cosine,
+                  'kl': _pdist_kl}
+
+def _block_size(metric, dim, n_cols, memory_budget):
+    # number of columns per block s.t. the temporaries of the distances to
+    # n_cols other columns fit the budget
+    if memory_budget is None:
+        memory_budget = MEMORY_BUDGET
+    if metric == 'l1':
+        per_col = 8 * dim * n_cols
     else:
-        for bidx in range(B.shape[1]):
-            if metric == 'l2':
-                d[:, bidx:bidx+1] = l2_distance(A[:,:], B[:,bidx:bidx+1]).reshape((-1,1))
-            if metric == 'l1':
-                d[:, bidx:bidx+1] = l1_distance(A[:,:], B[:,bidx:bidx+1]).reshape((-1,1))
-
-    return d
-
-def vq(A, B, metric='l2'):
+        per_col = 8 * (dim + 2 * n_cols)
+    return int(max(1, memory_budget // max(1, per_col)))
+
+def pdist(A, B, metric='l2', out=None, memory_budget=None):
+    """ Pairwise distances between the columns of a data matrix A (d x n)
+    and the columns of B (d x m).
+
+    The distances are computed by blocks of columns of A with vectorized
+    kernels (l2 and cosine use ||a||^2 + ||b||^2 - 2 a^T b, kl uses a
+    single product with log(B)), so the temporaries fit in memory_budget
+    bytes. A and B can be sparse or stored on disk (only a block of A is
+    read at a time).
+
+    Parameters
+    ----------
+    A : array_like, shape (d, n)
+    B : array_like, shape (d, m)
+    metric : {'l2', 'l1', 'cosine', 'kl'}
+    out : np.ndarray, shape (n, m), optional
+        C-contiguous float64 buffer to write the distances to.
+    memory_budget : int, optional
+        Memory (in bytes) for the temporaries (default: MEMORY_BUDGET).
+
+    Returns
+    -------
+    d : np.ndarray, shape (n, m)
+        the distance matrix.
+    """
+    if metric not in _PDIST_KERNELS:
+        raise ValueError("Unknown metric: %s" % metric)
+    kernel = _PDIST_KERNELS[metric]
+
+    n, m = A.shape[1], B.shape[1]
+    if out is None:
+        out = np.empty((n, m))
+
+    B = _dense(B[:,:])
+    B_sq = _sq_norms(B) if metric in ('l2', 'cosine') else None
+    step = _block_size(metric, B.shape[0], m, memory_budget)
+    for start in range(0, n, step):
+        stop = min(start + step, n)
+        kernel(_dense(A[:, start:stop]), B, out[start:stop], B_sq=B_sq)
+
+    return out
+
+def vq(A, B, metric='l2', memory_budget=None):
     # assigns data samples in B to cluster centers A and
     # returns an index list [assume n column vectors, d x n]
-    assigned = np.argmin(pdist(A,B, metric=metric), axis=0)
+    # -> B is processed by blocks, so the full distance matrix is never
+    # built; for l2, ||b||^2 and the sqrt don't change the assignments.
+    A = _dense(A[:,:])
+    m = B.shape[1]
+    assigned = np.empty(m, dtype=int)
+
+    step = _block_size(metric, A.shape[0], A.shape[1], memory_budget)
+    A_sq = _sq_norms(A)
+    for start in range(0, m, step):
+        stop = min(start + step, m)
+        B_block = _dense(B[:, start:stop])
+        if metric == 'l2':
+            d = np.dot(A.T, B_block)
+            d *= -2.0
+            d += A_sq[:, np.newaxis]
+        else:
+            d = pdist(A, B_block, metric=metric,
+                      memory_budget=memory_budget)
+        assigned[start:stop] = np.argmin(d, axis=0)
+
     return assigned
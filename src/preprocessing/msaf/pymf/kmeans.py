@@ -9,7 +9,8 @@ PyMF K-means clustering (unary-convex matrix factorization).
 
 
 import numpy as np
-import random
+import scipy.sparse
+import logging
 
 from . import dist
 from .nmf import NMF
@@ -18,7 +19,7 @@ __all__ = ["Kmeans"]
 
 class Kmeans(NMF):
     """
-    Kmeans(data, num_bases=4)
+    Kmeans(data, num_bases=4, seed=None)
 
     K-means clustering. Factorize a data matrix into two matrices s.t.
     F = | data - W*H | is minimal. H is restricted to unary vectors, W
@@ -31,11 +32,15 @@ class Kmeans(NMF):
     num_bases: int, optional
         Number of bases to compute (column rank of W and row rank of H).
         4 (default)
+    seed: int or np.random.RandomState, optional
+        Seed of the random initialization. None (default) draws from the
+        global numpy generator, so np.random.seed() applies.
 
     Attributes
     ----------
     W : "data_dimension x num_bases" matrix of basis vectors
-    H : "num bases x num_samples" matrix of coefficients
+    H : "num bases x num_samples" indicator matrix of the assignments
+    assigned : cluster index of each sample
     ferr : frobenius norm (after calling .factorize())
 
     Example
@@ -59,29 +64,135 @@ class Kmeans(NMF):
 
     The result is a set of coefficients kmeans_mdl.H, s.t. data = W * kmeans_mdl.H.
     """
+    def __init__(self, data, num_bases=4, seed=None):
+        NMF.__init__(self, data, num_bases=num_bases)
+
+        if seed is None:
+            self._rng = np.random
+        elif isinstance(seed, np.random.RandomState):
+            self._rng = seed
+        else:
+            self._rng = np.random.RandomState(seed)
+
     def init_h(self):
         # W has to be present for H to be initialized
-        self.H = np.zeros((self._num_bases, self._num_samples))
         self.update_h()
 
     def init_w(self):
         # set W to some random data samples
-        sel = random.sample(range(self._num_samples), self._num_bases)
+        sel = self._rng.choice(self._num_samples, self._num_bases,
+                               replace=False)
 
         # sort indices, otherwise h5py won't work
         self.W = self.data[:, np.sort(sel)]
 
-
     def update_h(self):
         # and assign samples to the best matching centers
-        self.assigned = dist.vq(self.W, self.data)
-        self.H = np.zeros(self.H.shape)
-        self.H[self.assigned, range(self._num_samples)] = 1.0
-
+        assigned = dist.vq(np.asarray(self.W), self.data)
+        self._changed = not np.array_equal(assigned,
+                                           getattr(self, 'assigned', None))
+        self.assigned = assigned
+        self._counts = np.bincount(assigned, minlength=self._num_bases)
+        # sparse indicator matrix for the updates of W, and its dense copy
+        # for the users of H
+        self._assigned_mat = scipy.sparse.csr_matrix(
+            (np.ones(self._num_samples), (assigned,
+                                          np.arange(self._num_samples))),
+            shape=(self._num_bases, self._num_samples))
+        self.H = self._assigned_mat.toarray()
 
     def update_w(self):
-        for i in range(self._num_bases):
-            idx = np.where(self.assigned==i)[0]
-            n = len(idx)
-            if n > 1:
-                self.W[:,i] = np.sum(self.data[:,idx], axis=1)/n
+        # sum of the samples of each cluster, H * data^T
+        sums = np.asarray(self._assigned_mat.dot(self.data[:,:].T)).T
+
+        # clusters of one sample (or none) keep their center
+        upd = self._counts > 1
+        W = np.array(self.W, dtype=np.float64)
+        W[:, upd] = sums[:, upd]/self._counts[upd]
+        self.W = W
+
+    def frobenius_norm(self):
+        """ Frobenius norm (||data - WH||) of the clustering, i.e. the
+        distances of the samples to their centers
+
+            ||data - WH||^2 = ||data||^2 - 2 sum_i w_{a_i}^T x_i
+                              + sum_k n_k ||w_k||^2
+
+        Returns:
+            frobenius norm: F = ||data - WH||
+        """
+        if getattr(self, '_data_sqnorm', None) is None:
+            self._data_sqnorm = np.sum(self.data[:,:]**2)
+
+        W = np.asarray(self.W)
+        err = self._data_sqnorm - \
+            2.0*np.einsum('ij,ij->', W[:, self.assigned], self.data[:,:]) + \
+            np.dot(self._counts, np.sum(W**2, axis=0))
+
+        return np.sqrt(max(err, 0.0))
+
+    fast_frobenius_norm = frobenius_norm
+
+    def factorize(self, niter=1, show_progress=False,
+                  compute_w=True, compute_h=True, compute_err=True):
+        """ Factorize s.t. WH = data, stopping as soon as the assignments
+            do not change anymore
+
+            Parameters
+            ----------
+            niter : int
+                    maximal number of iterations.
+            show_progress : bool
+                    print some extra information to stdout.
+            compute_h : bool
+                    iteratively update values for H.
+            compute_w : bool
+                    iteratively update values for W.
+            compute_err : bool
+                    compute Frobenius norm |data-WH| after each update and store
+                    it to .ferr[k].
+
+            Updated Values
+            --------------
+            .W : updated values for W.
+            .H : updated values for H.
+            .assigned : cluster index of each sample.
+            .ferr : Frobenius norm |data-WH| for each iteration.
+        """
+        if show_progress:
+            self._logger.setLevel(logging.INFO)
+        else:
+            self._logger.setLevel(logging.ERROR)
+
+        if not hasattr(self,'W'):
+            self.init_w()
+
+        if not hasattr(self,'H'):
+            self.init_h()
+
+        ferr = []
+        for i in range(niter):
+            if compute_w:
+                self.update_w()
+
+            if compute_h:
+                self.update_h()
+
+            if compute_err:
+                ferr.append(self.frobenius_norm())
+                self._logger.info('Iteration ' + str(i+1) + '/' + str(niter) +
+                                  ' FN:' + str(ferr[-1]))
+            else:
+                self._logger.info('Iteration ' + str(i+1) + '/' + str(niter))
+
+            # the centers only move if some assignment changed
+            if not (compute_w and compute_h) or not self._changed:
+                break
+
+        if compute_err:
+            self.ferr = np.array(ferr)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
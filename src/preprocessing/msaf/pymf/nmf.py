@@ -68,6 +68,11 @@ class NMF():
     # some small value
     _EPS = 10**-8
 
+    # relative tolerance on the change of the error to stop iterating,
+    # subclasses set their own (None keeps the original stopping on the
+    # absolute _EPS criterion, as plain NMF does)
+    _RTOL = None
+
     def __init__(self, data, num_bases=4):
 
         def setup_logging():
@@ -113,6 +118,44 @@ class NMF():
 
         return err
 
+    def fast_frobenius_norm(self):
+        """ Frobenius norm (||data - WH||) computed with the trace identity
+
+            ||data - WH||^2 = tr(data^T data) - 2 tr(H^T W^T data)
+                              + tr(W^T W H H^T)
+
+        tr(data^T data) is computed only once, and W^T data is reused from
+        the last update of H, so neither WH nor the residual are formed.
+
+        Returns:
+            frobenius norm: F = ||data - WH||
+        """
+        if scipy.sparse.issparse(self.data):
+            return self.frobenius_norm()
+
+        if getattr(self, '_data_sqnorm', None) is None:
+            self._data_sqnorm = np.sum(self.data[:,:]**2)
+
+        W = np.asarray(self.W)
+        H = np.asarray(self.H)
+        WtX = getattr(self, '_WtX', None)
+        if WtX is None:
+            WtX = np.dot(W.T, self.data[:,:])
+
+        err = self._data_sqnorm - 2.0*np.sum(WtX*H) + \
+            np.sum(np.dot(W.T, W)*np.dot(H, H.T))
+
+        return np.sqrt(max(err, 0.0))
+
+    def factorization_error(self):
+        """ Error tracked by .factorize(): the trace identity
+        (fast_frobenius_norm()) unless the class overrides frobenius_norm(),
+        whose own error measure is then used.
+        """
+        if type(self).frobenius_norm is NMF.frobenius_norm:
+            return self.fast_frobenius_norm()
+        return self.frobenius_norm()
+
     def init_w(self):
         self.W = np.random.random((self._data_dimension, self._num_bases))
 
@@ -122,7 +165,10 @@ class NMF():
     def update_h(self):
             # pre init H1, and H2 (necessary for storing matrices on disk)
             H2 = np.dot(np.dot(self.W.T, self.W), self.H) + 10**-9
-            self.H *= np.dot(self.W.T, self.data[:,:])
+            # keep W^T data for fast_frobenius_norm() (W does not change
+            # until the next iteration)
+            self._WtX = np.dot(self.W.T, self.data[:,:])
+            self.H *= self._WtX
             self.H /= H2
 
     def update_w(self):
@@ -132,6 +178,11 @@ class NMF():
             self.W /= W2
 
     def converged(self, i):
+        rtol = getattr(self, '_rtol', self._RTOL)
+        if rtol is not None:
+            derr = np.abs(self.ferr[i] - self.ferr[i-1])
+            return derr <= rtol*np.abs(self.ferr[i-1])
+
         derr = np.abs(self.ferr[i] - self.ferr[i-1])/self._num_samples
         if derr < self._EPS:
             return True
@@ -139,7 +190,8 @@ class NMF():
             return False
 
     def factorize(self, niter=1, show_progress=False,
-                  compute_w=True, compute_h=True, compute_err=True):
+                  compute_w=True, compute_h=True, compute_err=True,
+                  err_every=1, rtol=None):
         """ Factorize s.t. WH = data
 
             Parameters
@@ -155,12 +207,18 @@ class NMF():
             compute_err : bool
                     compute Frobenius norm |data-WH| after each update and store
                     it to .ferr[k].
+            err_every : int
+                    only compute the error (and check for convergence) every
+                    err_every iterations.
+            rtol : float
+                    stop when the relative change of the error is below rtol
+                    (default: the _RTOL of the class).
 
             Updated Values
             --------------
             .W : updated values for W.
             .H : updated values for H.
-            .ferr : Frobenius norm |data-WH| for each iteration.
+            .ferr : Frobenius norm |data-WH| for each error computation.
         """
 
         if show_progress:
@@ -176,30 +234,37 @@ class NMF():
         if not hasattr(self,'H'):
                 self.init_h()
 
+        self._rtol = self._RTOL if rtol is None else rtol
+
         if compute_err:
-            self.ferr = np.zeros(niter)
+            self.ferr = np.zeros(niter // err_every)
 
+        k = 0
         for i in range(niter):
+            self._WtX = None
+
             if compute_w:
                 self.update_w()
 
             if compute_h:
                 self.update_h()
 
-            if compute_err:
-                self.ferr[i] = self.frobenius_norm()
+            if compute_err and (i+1) % err_every == 0:
+                self.ferr[k] = self.factorization_error()
                 self._logger.info('Iteration ' + str(i+1) + '/' + str(niter) +
-                ' FN:' + str(self.ferr[i]))
-            else:
-                self._logger.info('Iteration ' + str(i+1) + '/' + str(niter))
-
+                ' FN:' + str(self.ferr[k]))
 
-            # check if the err is not changing anymore
-            if i > 1 and compute_err:
-                if self.converged(i):
+                # check if the err is not changing anymore
+                if k > 1 and self.converged(k):
                     # adjust the error measure
-                    self.ferr = self.ferr[:i]
+                    self.ferr = self.ferr[:k]
                     break
+                k += 1
+            else:
+                self._logger.info('Iteration ' + str(i+1) + '/' + str(niter))
+        else:
+            if compute_err:
+                self.ferr = self.ferr[:k]
 
 if __name__ == "__main__":
     import doctest
@@ -16,7 +16,10 @@ Matrix Factorization, Nature 401(6755), 788-799.
 
 
 import numpy as np
-from cvxopt import solvers, base
+try:
+    from cvxopt import solvers, base
+except ImportError:
+    solvers = base = None
 from .nmf import NMF
 
 __all__ = ["NMFALS"]
@@ -67,6 +70,11 @@ class NMFALS(NMF):
     The result is a set of coefficients nmf_mdl.H, s.t. data = W * nmf_mdl.H.
     """
 
+    def __init__(self, data, num_bases=4):
+        if solvers is None:
+            raise ImportError("NMFALS requires cvxopt")
+        NMF.__init__(self, data, num_bases=num_bases)
+
     def update_h(self):
         def updatesingleH(i):
             # optimize alpha using qp solver from cvxopt
@@ -18,19 +18,26 @@ import scipy.sparse
 import numpy as np
 
 from .dist import *
-from .aa import AA
+from . import dist
+from .aa import AA, simplex_lstsq
 
 __all__ = ["SIVM"]
 
 class SIVM(AA):
     """
-    SIVM(data, num_bases=4, dist_measure='l2')
+    SIVM(data, num_bases=4, dist_measure='l2', init='fastmap',
+         memory_budget=None)
 
 
     Simplex Volume Maximization. Factorize a data matrix into two matrices s.t.
     F = | data - W*H | is minimal. H is restricted to convexity. W is iteratively
     found by maximizing the volume of the resulting simplex (see [1]).
 
+    The data is processed by chunks of columns, so it can be a memory-mapped
+    array (np.memmap, np.load(..., mmap_mode='r')) or an h5py dataset that
+    does not fit into memory. The distances to the selected basis vectors are
+    cached and reused by later calls to update_w.
+
     Parameters
     ----------
     data : array_like, shape (_data_dimension, _num_samples)
@@ -45,6 +52,10 @@ class SIVM(AA):
         'fastmap' or 'origin'. Sets the method used for finding the very first
         basis vector. 'Origin' assumes the zero vector, 'Fastmap' picks one of
         the two vectors that have the largest pairwise distance.
+    memory_budget : int, optional
+        Approximate number of bytes of the data chunks (and temporaries) that
+        are processed at once. None uses pymf.dist.MEMORY_BUDGET.
+
     Attributes
     ----------
     W : "data_dimension x num_bases" matrix of basis vectors
@@ -77,12 +88,21 @@ class SIVM(AA):
     # -> any value other does not make sense.
     _NITER = 1
 
-    def __init__(self, data, num_bases=4, dist_measure='l2',  init='fastmap'):
+    # a single iteration is run, so the error is never compared between
+    # iterations (the stopping is unchanged)
+    _RTOL = None
+
+    def __init__(self, data, num_bases=4, dist_measure='l2',  init='fastmap',
+                 memory_budget=None):
 
         AA.__init__(self, data, num_bases=num_bases)
 
         self._dist_measure = dist_measure
         self._init = init
+        self._memory_budget = memory_budget
+
+        # distances of all samples to some of them (the selected ones)
+        self._dist_cache = {}
 
         # assign the correct distance function
         if self._dist_measure == 'l1':
@@ -104,13 +124,28 @@ class SIVM(AA):
             self._distfunc = kl_divergence
 
 
+    def _chunk_size(self):
+        """ number of data columns processed at once """
+        if scipy.sparse.issparse(self.data):
+            return self.data.shape[1]
+
+        budget = self._memory_budget
+        if budget is None:
+            budget = dist.MEMORY_BUDGET
+
+        # the chunk itself and a few temporaries of the same size
+        return int(max(1, budget // (8 * 4 * max(1, self.data.shape[0]))))
+
+    def _chunks(self):
+        """ column slices of the data, see _chunk_size() """
+        step = self._chunk_size()
+        for idx_start in range(0, self.data.shape[1], step):
+            yield slice(idx_start, min(idx_start + step, self.data.shape[1]))
+
     def _distance(self, idx):
         """ compute distances of a specific data point to all other samples"""
-
-        if scipy.sparse.issparse(self.data):
-            step = self.data.shape[1]
-        else:
-            step = 50000
+        if idx in self._dist_cache:
+            return self._dist_cache[idx]
 
         d = np.zeros((self.data.shape[1]))
         if idx == -1:
@@ -120,20 +155,19 @@ class SIVM(AA):
                 vec = scipy.sparse.csc_matrix(vec)
         else:
             vec = self.data[:, idx:idx+1]
+            if not scipy.sparse.issparse(self.data):
+                vec = np.asarray(vec, dtype=np.float64)
 
         self._logger.info('compute distance to node ' + str(idx))
 
-        # slice data into smaller chunks
-        for idx_start in range(0, self.data.shape[1], step):
-            if idx_start + step > self.data.shape[1]:
-                idx_end = self.data.shape[1]
-            else:
-                idx_end = idx_start + step
-
-            d[idx_start:idx_end] = self._distfunc(
-                self.data[:,idx_start:idx_end], vec)
-            self._logger.info('completed:' +
-                str(idx_end/(self.data.shape[1]/100.0)) + "%")
+        # slice data into smaller chunks (only one is in memory at a time)
+        for sl in self._chunks():
+            chunk = self.data[:, sl]
+            if not scipy.sparse.issparse(chunk):
+                chunk = np.asarray(chunk, dtype=np.float64)
+            d[sl] = self._distfunc(chunk, vec)
+
+        self._dist_cache[idx] = d
         return d
 
     def init_h(self):
@@ -142,6 +176,49 @@ class SIVM(AA):
     def init_w(self):
         self.W = np.zeros((self._data_dimension, self._num_bases))
 
+    def update_h(self):
+        """ alternating least squares step, update H under the convexity
+        constraint (by chunks of samples, see AA.update_h) """
+        W = np.asarray(self.W, dtype=np.float64)
+        for sl in self._chunks():
+            chunk = self.data[:, sl]
+            if scipy.sparse.issparse(chunk):
+                chunk = chunk.toarray()
+            self.H[:, sl] = simplex_lstsq(W, np.asarray(chunk, np.float64),
+                                          X=self.H[:, sl],
+                                          niter=self._SOLVER_NITER)
+
+    def fast_frobenius_norm(self):
+        """ Frobenius norm (||data - WH||) computed with the trace identity
+        (see NMF.fast_frobenius_norm()), accumulated by chunks of samples so
+        that the data is never loaded into memory at once
+
+        Returns:
+            frobenius norm: F = ||data - WH||
+        """
+        W = np.asarray(self.W, dtype=np.float64)
+        H = np.asarray(self.H)
+        data_sqnorm = getattr(self, '_data_sqnorm', None)
+        compute_sqnorm = data_sqnorm is None
+        if compute_sqnorm:
+            data_sqnorm = 0.0
+
+        cross = 0.0
+        for sl in self._chunks():
+            chunk = self.data[:, sl]
+            if scipy.sparse.issparse(chunk):
+                chunk = chunk.toarray()
+            chunk = np.asarray(chunk, dtype=np.float64)
+            if compute_sqnorm:
+                data_sqnorm += np.sum(chunk**2)
+            cross += np.sum(np.dot(W.T, chunk)*H[:, sl])
+        self._data_sqnorm = data_sqnorm
+
+        err = data_sqnorm - 2.0*cross + np.sum(np.dot(W.T, W)*np.dot(H, H.T))
+        return np.sqrt(max(err, 0.0))
+
+    frobenius_norm = fast_frobenius_norm
+
     def init_sivm(self):
         self.select = []
         if self._init == 'fastmap':
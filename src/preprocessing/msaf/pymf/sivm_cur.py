@@ -44,6 +44,8 @@ class SIVM_CUR(CUR):
         The distance measure for finding the next best candidate that
         maximizes the simplex volume ['l2','l1','cosine','sparse_graph_l2']
         'l2' (default)
+    memory_budget: int, optional
+        Bytes of the data chunks processed at once by SIVM (see pymf.SIVM).
 
     Attributes
     ----------
@@ -57,16 +59,18 @@ class SIVM_CUR(CUR):
     >>> sivmcur_mdl.factorize()
     '''
 
-    def __init__(self, data, k=-1, rrank=0, crank=0, dist_measure='l2', init='origin'):
+    def __init__(self, data, k=-1, rrank=0, crank=0, dist_measure='l2', init='origin',
+                 memory_budget=None):
         CUR.__init__(self, data, k=k, rrank=rrank, crank=rrank)
         self._dist_measure = dist_measure
         self.init = init
+        self._memory_budget = memory_budget
 
     def sample(self, A, c):
         # for optimizing the volume of the submatrix, set init to 'origin' (otherwise the volume of
         # the ordinary simplex would be optimized)
         sivm_mdl = SIVM(A, num_bases=c, dist_measure=self._dist_measure,
-                            init=self.init)
+                            init=self.init, memory_budget=self._memory_budget)
         sivm_mdl.factorize(show_progress=False, compute_w=True, niter=1,
                            compute_h=False, compute_err=False)
 
@@ -16,6 +16,7 @@ Conf. on Information and Knowledge Management. ACM. 2010.
 
 import logging
 import numpy as np
+import scipy.sparse
 from .dist import *
 from .vol import cmdet
 from .sivm import SIVM
@@ -33,6 +34,10 @@ class SIVM_GSAT(SIVM):
     applied to data streams using the .online_update_w(vec) function which decides
     on adding data sample "vec" to the already selected basis vectors.
 
+    Only the selected samples and the sampled candidates are read from the
+    data, and H and the error are computed by chunks of columns (see SIVM),
+    so the data can be memory-mapped.
+
     Parameters
     ----------
     data : array_like, shape (_data_dimension, _num_samples)
@@ -47,6 +52,10 @@ class SIVM_GSAT(SIVM):
         'fastmap' or 'origin'. Sets the method used for finding the very first
         basis vector. 'Origin' assumes the zero vector, 'Fastmap' picks one of
         the two vectors that have the largest pairwise distance.
+    memory_budget : int, optional
+        Approximate number of bytes of the data chunks (and temporaries) that
+        are processed at once. None uses pymf.dist.MEMORY_BUDGET.
+
     Attributes
     ----------
     W : "data_dimension x num_bases" matrix of basis vectors
@@ -75,9 +84,16 @@ class SIVM_GSAT(SIVM):
     The result is a set of coefficients sivm_mdl.H, s.t. data = W * sivm_mdl.H.
     """
 
+    def _sample(self, idx):
+        """ dense copy of a data sample """
+        vec = self.data[:, idx:idx+1]
+        if scipy.sparse.issparse(vec):
+            vec = vec.toarray()
+        return np.asarray(vec, dtype=np.float64).ravel()
+
     def init_w(self):
-        self.select = range(self._num_bases)
-        self.W = self.data[:, self.select]
+        self.select = list(range(self._num_bases))
+        self.W = np.column_stack([self._sample(i) for i in self.select])
 
     def online_update_w(self, vec):
         # update D if it does not exist
@@ -117,9 +133,9 @@ class SIVM_GSAT(SIVM):
         return False,-1
 
     def update_w(self):
-        n = np.int(np.floor(np.random.random() * self._num_samples))
+        n = int(np.floor(np.random.random() * self._num_samples))
         if n not in self.select:
-            updated, s = self.online_update_w(self.data[:,n])
+            updated, s = self.online_update_w(self._sample(n))
             if updated:
                 self.select[s] = n
                 self._logger.info('Current selection:' + str(self.select))
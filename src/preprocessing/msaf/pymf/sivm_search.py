@@ -16,11 +16,6 @@ Conf. on Information and Knowledge Management. ACM. 2010.
 
 import scipy.sparse
 import numpy as np
-from scipy import inf
-try:
-    from scipy.misc.common import factorial
-except:
-    from scipy.misc import factorial
 
 from .dist import *
 from .vol import *
@@ -38,6 +33,10 @@ class SIVM_SEARCH(SIVM):
     found by maximizing the volume of the resulting simplex (see [1]). A solution
     is found by employing a simple A-star like search strategy.
 
+    The distance matrix of the data is never built: only the distances of the
+    expanded samples to all the others are computed, by chunks of columns
+    (see memory_budget), so the data can be memory-mapped.
+
     Parameters
     ----------
     data : array_like, shape (_data_dimension, _num_samples)
@@ -52,6 +51,10 @@ class SIVM_SEARCH(SIVM):
         'fastmap' or 'origin'. Sets the method used for finding the very first
         basis vector. 'Origin' assumes the zero vector, 'Fastmap' picks one of
         the two vectors that have the largest pairwise distance.
+    memory_budget : int, optional
+        Approximate number of bytes of the data chunks (and temporaries) that
+        are processed at once. None uses pymf.dist.MEMORY_BUDGET.
+
     Attributes
     ----------
     W : "data_dimension x num_bases" matrix of basis vectors
@@ -80,58 +83,92 @@ class SIVM_SEARCH(SIVM):
     The result is a set of coefficients sivm_mdl.H, s.t. data = W * sivm_mdl.H.
     """
 
+    def _max_distance(self):
+        """ maximal distance between two samples, computed by blocks of
+        samples (the distance matrix is never built) """
+        mv = 0.0
+        chunks = list(self._chunks())
+        for i, sl_i in enumerate(chunks):
+            for sl_j in chunks[i:]:
+                d = pdist(self.data[:, sl_i], self.data[:, sl_j],
+                          memory_budget=self._memory_budget)
+                mv = max(mv, np.max(d))
+        return mv
+
+    def _search_distance(self, idx):
+        """ distances of a sample to all the samples (as in the distance
+        matrix of the search), computed by chunks and cached """
+        if idx not in self._search_dist_cache:
+            d = np.zeros(self._num_samples)
+            vec = self.data[:, idx:idx+1]
+            for sl in self._chunks():
+                d[sl] = pdist(self.data[:, sl], vec,
+                              memory_budget=self._memory_budget)[:, 0]
+            self._search_dist_cache[idx] = d
+        return self._search_dist_cache[idx]
+
     def update_w(self):
-        def h(sel,D,k):
+        def h(sel, mv, k):
             # compute the volume for a selection of sel columns
             # and a k-1 simplex (-> k columns have to be selected)
-            mv = np.max(D)
 
             # fill the remaining distance by the maximal overall found distance
             d = np.zeros((k,k)) + mv
             for i in range(k):
                 d[i,i] = 0.0
 
+            # the distances of the last sample are in the rows of the others
             for idx_i,i in enumerate(sel):
                 for idx_j,j in enumerate(sel):
-                    d[idx_i,idx_j] = D[i,j]
+                    if i in self._search_dist_cache:
+                        d[idx_i,idx_j] = self._search_dist_cache[i][j]
+                    elif j in self._search_dist_cache:
+                        d[idx_i,idx_j] = self._search_dist_cache[j][i]
+                    else:
+                        d[idx_i,idx_j] = self._search_distance(i)[j]
 
             return d
 
-        # compute distance matrix -> required for the volume
-        D = pdist(self.data, self.data)
+        # maximal distance -> required for the volume
+        self._search_dist_cache = {}
+        mv = self._max_distance()
         Openset = {}
 
+        # all single samples have the same volume
+        Vtmp = cmdet(h([], mv, self._num_bases))
         for i in range(self._num_samples):
-            # compute volume for temp selection
-            d = h([i],D,self._num_bases)
-            Vtmp = cmdet(d)
             Openset[tuple([i])] = Vtmp
 
         Closedset = {}
         finished = False
         self._v = []
         self.init_sivm()
-        next_sel = np.array([self.select[0]])
+        # (-1, the origin, is the last sample in the distance matrix)
+        next_sel = tuple([int(self.select[0]) % self._num_samples])
         iter = 0
 
         while not finished:
             # add the current selection to closedset
-            Closedset[(tuple(next_sel))] = []
+            Closedset[next_sel] = []
+
+            # distances of the current selection to all the samples
+            for j in next_sel:
+                self._search_distance(j)
 
-            for i in range(D.shape[0]):
+            for i in range(self._num_samples):
                 # create a temp selection
                 tmp_sel = np.array(next_sel).flatten()
                 tmp_sel = np.concatenate((tmp_sel, [i]),axis=0)
                 tmp_sel = np.unique(tmp_sel)
-                tmp_sel = list(tmp_sel)
+                tmp_sel = [int(j) for j in tmp_sel]
                 hkey = tuple(tmp_sel)
 
                 if len(tmp_sel) > len(next_sel) and (
-                    not Closedset.has_key(hkey)) and (
-                    not Openset.has_key(hkey)):
+                    hkey not in Closedset) and (
+                    hkey not in Openset):
 
                     # compute volume for temp selection
-                    d = h(tmp_sel, D, self._num_bases)
+                    d = h(tmp_sel, mv, self._num_bases)
                     Vtmp = cmdet(d)
 
                     # add to openset
@@ -139,7 +176,7 @@ class SIVM_SEARCH(SIVM):
 
             # get next best tuple
             vmax = 0.0
-            for (k,v) in Openset.iteritems():
+            for (k,v) in Openset.items():
                 if v > vmax:
                     next_sel = k
                     vmax = v
@@ -158,7 +195,8 @@ class SIVM_SEARCH(SIVM):
 
         # update some values ...
         self.select = list(next_sel)
-        self.W = self.data[:, self.select]
+        self.W = self.data[:, np.sort(self.select)]
+        self.W = self.W[:, np.argsort(np.argsort(self.select))]
 
 if __name__ == "__main__":
     import doctest
@@ -14,8 +14,8 @@ PyMF functions for computing matrix/simplex volumes
 
 import numpy as np
 try:
-	from scipy.misc.common import factorial
-except:
+	from scipy.special import factorial
+except ImportError:
 	from scipy.misc import factorial
 
 __all__ = ["cmdet", "simplex"]
@@ -2,18 +2,22 @@
 This module contains multiple functions in order to run MSAF algorithms.
 """
 from copy import deepcopy
-from joblib import Parallel, delayed
+import hashlib
+import json
 import librosa
 import logging
 import numpy as np
 import os
+import time
+import traceback
 
 import msaf
 from msaf import input_output as io
+from msaf import scheduler
 from msaf import utils
-from msaf import plotting
 from msaf.features import Features
-from msaf.exceptions import NoHierBoundaryError, NoAudioFileError
+from msaf.exceptions import NoHierBoundaryError, NoAudioFileError, \
+    MSAFError
 import msaf.algorithms as algorithms
 
 
@@ -33,11 +37,7 @@ def get_boundaries_module(boundaries_id):
     """
     if boundaries_id == "gt":
         return None
-    try:
-        module = eval(algorithms.__name__ + "." + boundaries_id)
-    except AttributeError:
-        raise RuntimeError("Algorithm %s can not be found in msaf!" %
-                           boundaries_id)
+    module = algorithms.get_algorithm(boundaries_id)
     if not module.is_boundary_type:
         raise RuntimeError("Algorithm %s can not identify boundaries!" %
                            boundaries_id)
@@ -60,19 +60,68 @@ def get_labels_module(labels_id):
     """
     if labels_id is None:
         return None
-    try:
-        module = eval(algorithms.__name__ + "." + labels_id)
-    except AttributeError:
-        raise RuntimeError("Algorithm %s can not be found in msaf!" %
-                           labels_id)
+    module = algorithms.get_algorithm(labels_id)
     if not module.is_label_type:
         raise RuntimeError("Algorithm %s can not label segments!" %
                            labels_id)
     return module
 
 
+def get_boundaries_key(bounds_module, config):
+    """Obtains the key of the boundaries estimated for a track: the boundary
+    algorithm, its parameters, and the features."""
+    params = [config[key] for key in ("feature", "annot_beats", "framesync",
+                                      "hier")]
+    params += [(key, config.get(key)) for key in sorted(bounds_module.config)]
+    return json.dumps([bounds_module.algo_id, params], default=repr)
+
+
+def _cached(intermediates, key, compute):
+    """Computes a value, or reuses it from the intermediates of the track
+    (if given) when it was already computed for another configuration.
+
+    The state of the random generator after computing the value is kept with
+    it and restored when it is reused, so the next steps (e.g., the labels
+    algorithm) get the same random draws as if it had been computed again.
+    """
+    if intermediates is None:
+        return compute()
+    if key not in intermediates:
+        value = compute()
+        intermediates[key] = value, np.random.get_state()
+    value, rng_state = intermediates[key]
+    np.random.set_state(rng_state)
+    return deepcopy(value)
+
+
+def get_task_config(config):
+    """Obtains the configuration to send to the workers: the parameters of
+    the algorithms, without the features (which the workers read from the
+    features files themselves)."""
+    return dict((key, val) for key, val in config.items()
+                if key != "features" and not isinstance(val, Features))
+
+
+def preload_algorithms(boundaries_id, labels_id, config):
+    """Imports the segmenters of the algorithms and loads their models
+    (e.g., the OLDA transform) in the current process.
+
+    The algorithms can define a `preload(config)` function in their
+    segmenter for this. Since the models are memory-mapped, the processes
+    forked afterwards share them instead of loading them again.
+    """
+    for module in (get_boundaries_module(boundaries_id),
+                   get_labels_module(labels_id)):
+        if module is None:
+            continue
+        module.Segmenter
+        preload = getattr(module, "preload", None)
+        if preload is not None:
+            preload(config)
+
+
 def run_hierarchical(audio_file, bounds_module, labels_module, frame_times,
-                     config, annotator_id=0):
+                     config, annotator_id=0, intermediates=None):
     """Runs hierarchical algorithms with the specified identifiers on the
     audio_file. See run_algorithm for more information.
     """
@@ -85,8 +134,10 @@ def run_hierarchical(audio_file, bounds_module, labels_module, frame_times,
     features = config["features"].features
 
     # Compute boundaries
-    S = bounds_module.Segmenter(audio_file, **config)
-    est_idxs, est_labels = S.processHierarchical()
+    est_idxs, est_labels = _cached(
+        intermediates, get_boundaries_key(bounds_module, config),
+        lambda: bounds_module.Segmenter(audio_file,
+                                        **config).processHierarchical())
 
     # Compute labels if needed
     if labels_module is not None and \
@@ -117,7 +168,7 @@ def run_hierarchical(audio_file, bounds_module, labels_module, frame_times,
 
 
 def run_flat(file_struct, bounds_module, labels_module, frame_times, config,
-             annotator_id):
+             annotator_id, intermediates=None):
     """Runs the flat algorithms with the specified identifiers on the
     audio_file. See run_algorithm for more information.
     """
@@ -134,8 +185,10 @@ def run_flat(file_struct, bounds_module, labels_module, frame_times, config,
     else:
         # Identify segment boundaries
         if bounds_module is not None:
-            S = bounds_module.Segmenter(file_struct, in_labels=[], **config)
-            est_idxs, est_labels = S.processFlat()
+            est_idxs, est_labels = _cached(
+                intermediates, get_boundaries_key(bounds_module, config),
+                lambda: bounds_module.Segmenter(file_struct, in_labels=[],
+                                                **config).processFlat())
         else:
             try:
                 # Ground-truth boundaries
@@ -168,7 +221,7 @@ def run_flat(file_struct, bounds_module, labels_module, frame_times, config,
 
 
 def run_algorithms(file_struct, boundaries_id, labels_id, config,
-                   annotator_id=0):
+                   annotator_id=0, intermediates=None):
     """Runs the algorithms with the specified identifiers on the audio_file.
 
     Parameters
@@ -183,6 +236,10 @@ def run_algorithms(file_struct, boundaries_id, labels_id, config,
         Dictionary containing the custom parameters of the algorithms to use.
     annotator_id: int
         Annotator identificator in the ground truth.
+    intermediates: dict
+        If given, the boundaries estimated for the track are kept in it, and
+        reused by the next configurations with the same boundary algorithm,
+        parameters and features (e.g., when only the labels differ).
 
     Returns
     -------
@@ -212,7 +269,8 @@ def run_algorithms(file_struct, boundaries_id, labels_id, config,
     # Segment audio based on type of segmentation
     run_fun = run_hierarchical if config["hier"] else run_flat
     est_times, est_labels = run_fun(file_struct, bounds_module, labels_module,
-                                    frame_times, config, annotator_id)
+                                    frame_times, config, annotator_id,
+                                    intermediates=intermediates)
 
     return est_times, est_labels
 
@@ -245,6 +303,7 @@ def process_track(file_struct, boundaries_id, labels_id, config,
     logging.info("Segmenting %s" % file_struct.audio_file)
 
     # Get features
+    config = dict(config)
     config["features"] = Features.select_features(
         config["feature"], file_struct, config["annot_beats"],
         config["framesync"])
@@ -262,11 +321,165 @@ def process_track(file_struct, boundaries_id, labels_id, config,
     return est_times, est_labels
 
 
+def get_run_key(boundaries_id, labels_id, config, annotator_id=0):
+    """Obtains the key of a collection run: a hash of the algorithms and
+    their parameters (without the features)."""
+    params = get_task_config(config)
+    desc = json.dumps([boundaries_id, labels_id, annotator_id, params],
+                      sort_keys=True, default=repr)
+    return hashlib.sha1(desc.encode("utf-8")).hexdigest()
+
+
+def get_input_key(file_struct):
+    """Obtains the key of the inputs of a track (size and modification time
+    of its audio file)."""
+    stat = os.stat(file_struct.audio_file)
+    return "%d:%d" % (stat.st_size, int(stat.st_mtime * 1e6))
+
+
+def read_track_estimations(file_struct, boundaries_id, labels_id, config):
+    """Reads the saved estimations of a track, in the format returned by
+    `process_track`."""
+    params = get_task_config(config)
+    est_inters, est_labels = io.read_estimations(
+        file_struct.est_file, boundaries_id, labels_id, **params)
+
+    # Labels are saved as letters (see `io.save_estimations`)
+    def to_times_labels(inters, labels):
+        return utils.intervals_to_times(np.asarray(inters)), \
+            np.asarray([ord(label) - 65 for label in labels], dtype=int)
+
+    if config["hier"]:
+        levels = [to_times_labels(inters, labels)
+                  for inters, labels in zip(est_inters, est_labels)]
+        return [level[0] for level in levels], [level[1] for level in levels]
+    return to_times_labels(est_inters, est_labels)
+
+
+def process_collection(in_path, boundaries_id, labels_id, config, n_jobs=4,
+                       annotator_id=0, resume=True, stats=None):
+    """Segments the tracks of a collection, yielding the results of each
+    track as soon as it finishes.
+
+    Every finished track is recorded in the completion manifest of the
+    collection (see `io.get_manifest_file`), so that a rerun with the same
+    algorithms and parameters skips the tracks whose audio files have not
+    changed. A track that fails is logged and recorded as failed, and the
+    rest of the collection is still processed. The tracks are dispatched
+    longest-first to the processes (see `msaf.scheduler.map_tracks`).
+
+    Parameters
+    ----------
+    in_path: str
+        Path to the dataset.
+    boundaries_id: str
+        Identifier of the boundaries algorithm to use ("gt" for ground truth).
+    labels_id: str
+        Identifier of the labels algorithm to use (None for not labeling).
+    config: dict
+        Dictionary containing the custom parameters of the algorithms to use.
+    n_jobs: int
+        Number of processes to run in parallel (negative to use all the
+        cores but `-n_jobs - 1`).
+    annotator_id: int
+        Annotator identificator in the ground truth.
+    resume: bool
+        Whether to skip the tracks that are already done according to the
+        manifest. Their saved estimations are yielded instead.
+    stats: dict
+        If given, it is filled with the counts of the tracks that are done,
+        skipped and failed (and their errors), and with the core utilization
+        of the processes (see `msaf.scheduler.map_tracks`), updated as the
+        tracks finish.
+
+    Yields
+    ------
+    file_struct: `msaf.io.FileStruct`
+        FileStruct of the finished track.
+    est_times: np.array or list
+        Estimated times for the segment boundaries (see `process_track`).
+    est_labels: np.array or list
+        Estimated labels of the segments (see `process_track`).
+    """
+    start = time.time()
+    config = get_task_config(config)
+    file_structs = io.get_dataset_files(in_path)
+    manifest_file = io.get_manifest_file(in_path)
+    manifest = io.read_manifest(manifest_file) if resume else {}
+    run_key = get_run_key(boundaries_id, labels_id, config, annotator_id)
+
+    if stats is None:
+        stats = {}
+    stats.update(n_tracks=len(file_structs), n_done=0, n_skipped=0,
+                 n_failed=0, failed={}, elapsed=0.0)
+
+    # Skip the tracks that are already done
+    input_keys = {}
+    pending = []
+    for file_struct in file_structs:
+        input_keys[file_struct.audio_file] = get_input_key(file_struct)
+        entry = manifest.get((run_key, file_struct.audio_file))
+        if entry is not None and entry["status"] == "done" and \
+                entry["input"] == input_keys[file_struct.audio_file]:
+            try:
+                est_times, est_labels = read_track_estimations(
+                    file_struct, boundaries_id, labels_id, config)
+            except (IOError, ValueError, MSAFError):
+                logging.warning("Could not read the estimations of %s, "
+                                "processing it again" %
+                                file_struct.audio_file)
+            else:
+                stats["n_skipped"] += 1
+                yield file_struct, est_times, est_labels
+                continue
+        pending.append(file_struct)
+
+    if stats["n_skipped"] > 0:
+        logging.info("Skipping %d tracks that are already done" %
+                     stats["n_skipped"])
+    if pending:
+        preload_algorithms(boundaries_id, labels_id, config)
+
+    for i, (file_struct, result, error) in enumerate(scheduler.map_tracks(
+            process_track, pending, args=(boundaries_id, labels_id, config),
+            kwargs=dict(annotator_id=annotator_id), n_jobs=n_jobs,
+            stats=stats)):
+        entry = {
+            "run": run_key,
+            "track": file_struct.audio_file,
+            "input": input_keys[file_struct.audio_file],
+            "boundaries_id": boundaries_id,
+            "labels_id": labels_id,
+            "timestamp": time.strftime("%Y/%m/%d %H:%M:%S")
+        }
+        if error is None:
+            entry["status"] = "done"
+            stats["n_done"] += 1
+        else:
+            entry["status"] = "failed"
+            entry["error"] = error.strip().splitlines()[-1]
+            stats["n_failed"] += 1
+            stats["failed"][file_struct.audio_file] = error
+            logging.error("Could not segment %s:\n%s" %
+                          (file_struct.audio_file, error))
+        io.append_manifest(manifest_file, entry)
+        stats["elapsed"] = time.time() - start
+        logging.info("[%d/%d] %s %s" % (i + 1, len(pending), entry["status"],
+                                        file_struct.audio_file))
+
+        if error is None:
+            est_times, est_labels = result
+            yield file_struct, est_times, est_labels
+
+    stats["elapsed"] = time.time() - start
+
+
 def process(in_path, annot_beats=False, feature="pcp", framesync=False,
             boundaries_id=msaf.config.default_bound_id,
             labels_id=msaf.config.default_label_id, hier=False,
             sonify_bounds=False, plot=False, n_jobs=4, annotator_id=0,
-            config=None, out_bounds="out_bounds.wav", out_sr=22050):
+            config=None, out_bounds="out_bounds.wav", out_sr=22050,
+            resume=True, stats=None):
     """Main process to segment a file or a collection of files.
 
     Parameters
@@ -294,6 +507,13 @@ def process(in_path, annot_beats=False, feature="pcp", framesync=False,
     n_jobs: int
         Number of processes to run in parallel. Only available in collection
         mode.
+    resume: bool
+        Whether to skip the tracks that are already done in a previous run
+        with the same parameters. Only available in collection mode (see
+        `process_collection`).
+    stats: dict
+        If given, it is filled with the statistics of the collection run,
+        e.g., the core utilization (see `process_collection`).
     annotator_id: int
         Annotator identificator in the ground truth.
     config: dict
@@ -309,8 +529,9 @@ def process(in_path, annot_beats=False, feature="pcp", framesync=False,
     -------
     results : list
         List containing tuples of (est_times, est_labels) of estimated
-        boundary times and estimated labels.
+        boundary times and estimated labels, sorted by audio file.
         If labels_id is None, est_labels will be a list of -1.
+        If a track failed, both will be None.
     """
     # Seed random to reproduce results
     np.random.seed(123)
@@ -320,6 +541,10 @@ def process(in_path, annot_beats=False, feature="pcp", framesync=False,
         config = io.get_configuration(feature, annot_beats, framesync,
                                       boundaries_id, labels_id)
         config["features"] = None
+    else:
+        # Do not modify the configuration of the caller, which may be shared
+        # with other calls (e.g., from other threads)
+        config = dict(config)
 
     # Save multi-segment (hierarchical) configuration
     config["hier"] = hier
@@ -328,11 +553,8 @@ def process(in_path, annot_beats=False, feature="pcp", framesync=False,
                                in_path)
     if os.path.isfile(in_path):
         # Single file mode
-        # Get (if they exitst) or compute features
-        file_struct = msaf.io.FileStruct(in_path)
-
-        # Use temporary file in single mode
-        file_struct.features_file = msaf.config.features_tmp_file
+        # Compute the features, keeping them in memory
+        file_struct = msaf.io.FileStruct(in_path, in_memory=True)
 
         # Get features
         config["features"] = Features.select_features(
@@ -349,6 +571,7 @@ def process(in_path, annot_beats=False, feature="pcp", framesync=False,
             utils.sonify_clicks(audio_hq, est_times, out_bounds, out_sr)
 
         if plot:
+            from msaf import plotting
             plotting.plot_one_track(file_struct, est_times, est_labels,
                                     boundaries_id, labels_id)
 
@@ -361,8 +584,179 @@ def process(in_path, annot_beats=False, feature="pcp", framesync=False,
         return est_times, est_labels
     else:
         # Collection mode
-        file_structs = io.get_dataset_files(in_path)
+        results = {}
+        for file_struct, est_times, est_labels in process_collection(
+                in_path, boundaries_id, labels_id, config, n_jobs=n_jobs,
+                annotator_id=annotator_id, resume=resume, stats=stats):
+            results[file_struct.audio_file] = est_times, est_labels
+
+        return [results.get(file_struct.audio_file, (None, None))
+                for file_struct in io.get_dataset_files(in_path)]
+
+
+def get_grid_configurations(combinations):
+    """Obtains the algorithm identifiers and the configuration of each
+    combination of a grid run (see `process_grid`).
+
+    Returns
+    -------
+    configurations: list
+        Tuples of (boundaries_id, labels_id, config).
+    """
+    configurations = []
+    for combination in combinations:
+        boundaries_id = combination.get("boundaries_id",
+                                        msaf.config.default_bound_id)
+        labels_id = combination.get("labels_id", msaf.config.default_label_id)
+        config = io.get_configuration(
+            combination.get("feature", "pcp"),
+            combination.get("annot_beats", False),
+            combination.get("framesync", False), boundaries_id, labels_id)
+        config.update(combination.get("config") or {})
+        config["hier"] = combination.get("hier", False)
+        config = get_task_config(config)
+        configurations.append((boundaries_id, labels_id, config))
+    return configurations
+
+
+def process_track_grid(file_struct, configurations, annotator_id=0,
+                       save=True):
+    """Runs all the configurations on a track, loading its features once,
+    and saves all the estimations in a single write.
+
+    Parameters
+    ----------
+    file_struct: `msaf.io.FileStruct`
+        FileStruct containing the paths of the input files.
+    configurations: list
+        Tuples of (boundaries_id, labels_id, config) to run (see
+        `get_grid_configurations`).
+    annotator_id: int
+        Annotator identificator in the ground truth.
+    save: bool
+        Whether to save the estimations.
+
+    Returns
+    -------
+    results: list
+        Tuples of (est_times, est_labels, error) of each configuration.
+        If a configuration failed, the estimations are None and the error
+        is its traceback.
+    """
+    logging.info("Segmenting %s with %d configurations" %
+                 (file_struct.audio_file, len(configurations)))
+
+    features = {}
+    intermediates = {}
+    results = []
+    estimations = []
+    for boundaries_id, labels_id, config in configurations:
+        # Seed random for each configuration as `process` does, so its
+        # results do not depend on the other configurations of the grid
+        # (see `_cached` for the shared boundaries)
+        np.random.seed(123)
+        config = dict(config)
+        feat_key = (config["feature"], config["annot_beats"],
+                    config["framesync"])
+        try:
+            if feat_key not in features:
+                features[feat_key] = Features.select_features(
+                    config["feature"], file_struct, config["annot_beats"],
+                    config["framesync"])
+            config["features"] = features[feat_key]
+            est_times, est_labels = run_algorithms(
+                file_struct, boundaries_id, labels_id, config,
+                annotator_id=annotator_id, intermediates=intermediates)
+        except Exception:
+            results.append((None, None, traceback.format_exc()))
+            continue
+        results.append((est_times, est_labels, None))
+        estimations.append((est_times, est_labels, boundaries_id, labels_id,
+                            config))
+
+    if save and estimations:
+        logging.info("Writing %d results in: %s" %
+                     (len(estimations), file_struct.est_file))
+        io.save_estimations_batch(file_struct, estimations)
+
+    return results
+
+
+def process_grid(in_path, combinations, n_jobs=4, annotator_id=0,
+                 stats=None):
+    """Segments a file or a collection of files with multiple combinations
+    of algorithms and parameters.
+
+    Each track is processed once by a single worker, which loads its
+    features once for all the combinations, reuses the boundaries shared by
+    combinations that only differ in their labels, and saves all their
+    estimations at once.
+
+    Parameters
+    ----------
+    in_path: str
+        Input path. If a directory, MSAF will function in collection mode.
+        If audio file, MSAF will be in single file mode (and the estimations
+        are not saved).
+    combinations: list
+        Dictionaries with the parameters of each combination, with the same
+        names (and defaults) as in `process`: "boundaries_id", "labels_id",
+        "feature", "annot_beats", "framesync", and "hier". The "config"
+        entry, if any, overrides the default parameters of the algorithms.
+    n_jobs: int
+        Number of processes to run in parallel. Only available in collection
+        mode.
+    annotator_id: int
+        Annotator identificator in the ground truth.
+    stats: dict
+        If given, it is filled with the core utilization of the processes
+        (see `msaf.scheduler.map_tracks`), and the errors of the failed
+        tracks and combinations.
 
-        return Parallel(n_jobs=n_jobs)(delayed(process_track)(
-            file_struct, boundaries_id, labels_id, config,
-            annotator_id=annotator_id) for file_struct in file_structs[:])
+    Returns
+    -------
+    results: list
+        For each combination, the list of tuples (est_times, est_labels) of
+        the tracks, sorted by audio file, as returned by `process`.
+        If a combination failed on a track, both will be None.
+    """
+    if not os.path.exists(in_path):
+        raise NoAudioFileError("File or directory does not exists, %s" %
+                               in_path)
+    configurations = get_grid_configurations(combinations)
+    for boundaries_id, labels_id, config in configurations:
+        preload_algorithms(boundaries_id, labels_id, config)
+    if stats is None:
+        stats = {}
+    stats["failed"] = {}
+
+    if os.path.isfile(in_path):
+        # Single file mode
+        file_struct = msaf.io.FileStruct(in_path, in_memory=True)
+        file_structs = [file_struct]
+        tracks = [(file_struct, process_track_grid(
+            file_struct, configurations, annotator_id=annotator_id,
+            save=False), None)]
+    else:
+        # Collection mode
+        file_structs = io.get_dataset_files(in_path)
+        tracks = scheduler.map_tracks(
+            process_track_grid, file_structs, args=(configurations,),
+            kwargs=dict(annotator_id=annotator_id), n_jobs=n_jobs,
+            stats=stats)
+
+    track_results = {}
+    for file_struct, results, error in tracks:
+        if error is not None:
+            results = [(None, None, error)] * len(configurations)
+        for i, (_, _, error) in enumerate(results):
+            if error is not None:
+                stats["failed"][(file_struct.audio_file, i)] = error
+                logging.error("Could not segment %s with %s:\n%s" %
+                              (file_struct.audio_file, combinations[i],
+                               error))
+        track_results[file_struct.audio_file] = results
+
+    return [[track_results[file_struct.audio_file][i][:2]
+             for file_struct in file_structs]
+            for i in range(len(configurations))]
@@ -0,0 +1,229 @@
+"""
+Scheduling of the tracks of a collection over multiple processes.
+
+The tracks are dispatched longest-first: the cost of each track is estimated
+from cheap metadata, and the tracks are submitted to the process pool in
+decreasing order of cost. The pool hands the next track to whichever worker
+becomes free, so the short tracks fill the gaps left by the long ones,
+instead of a long track starting last and running alone on one core.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import logging
+import multiprocessing
+import os
+import pickle
+import time
+import traceback
+import zipfile
+
+import numpy as np
+
+
+def get_n_jobs(n_jobs):
+    """Obtains the number of processes to use. As in joblib, negative values
+    count from the number of cores (-1 to use all of them)."""
+    if n_jobs < 0:
+        n_jobs = multiprocessing.cpu_count() + 1 + n_jobs
+    return max(n_jobs, 1)
+
+
+def read_npz_length(npz_file):
+    """Reads the number of time steps of a pianoroll `.npz` file (as saved
+    by pypianoroll) from the array headers, without loading the pianorolls.
+
+    Parameters
+    ----------
+    npz_file: str
+        Path to the `.npz` file.
+
+    Returns
+    -------
+    length: int
+        Number of time steps of the longest track, or `None` if no pianoroll
+        was found in the file.
+    """
+    length = None
+    with zipfile.ZipFile(npz_file) as archive:
+        for name in archive.namelist():
+            if not name.startswith("pianoroll"):
+                continue
+            with archive.open(name) as f:
+                if name.endswith("_csc_shape.npy"):
+                    # Sparse pianoroll: its shape is a tiny array
+                    n = int(np.lib.format.read_array(f)[0])
+                elif name.endswith(".npy") and "_csc_" not in name:
+                    # Dense pianoroll: read the shape from the header
+                    version = np.lib.format.read_magic(f)
+                    if version == (1, 0):
+                        shape = np.lib.format.read_array_header_1_0(f)[0]
+                    else:
+                        shape = np.lib.format.read_array_header_2_0(f)[0]
+                    n = shape[0]
+                else:
+                    continue
+            length = n if length is None else max(length, n)
+    return length
+
+
+def estimate_track_cost(file_struct):
+    """Estimates the relative cost of processing a track.
+
+    The cost is the number of time steps of the pianoroll, read from the
+    header of the `.npz` file. For other formats, the size of the cached
+    features file (or of the audio file if there is none) is used, which is
+    roughly proportional to it. Costs are only compared between the tracks
+    of the same collection.
+
+    Parameters
+    ----------
+    file_struct: `msaf.io.FileStruct`
+        Object with the file paths of the track.
+
+    Returns
+    -------
+    cost: float
+        Estimated cost (0 if it could not be estimated).
+    """
+    try:
+        if zipfile.is_zipfile(file_struct.audio_file):
+            length = read_npz_length(file_struct.audio_file)
+            if length is not None:
+                return float(length)
+        if os.path.isfile(file_struct.features_file):
+            return float(os.path.getsize(file_struct.features_file))
+        return float(os.path.getsize(file_struct.audio_file))
+    except (IOError, OSError, ValueError, zipfile.BadZipfile):
+        return 0.0
+
+
+def schedule_tracks(file_structs):
+    """Sorts the tracks by decreasing estimated cost (longest first)."""
+    costs = dict((file_struct.audio_file, estimate_track_cost(file_struct))
+                 for file_struct in file_structs)
+    return sorted(file_structs, key=lambda file_struct:
+                  -costs[file_struct.audio_file])
+
+
+def _pickled_size(obj):
+    """Size in bytes of the object once pickled, as sent between
+    processes."""
+    return len(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+
+
+def _call_track(func, file_struct, args, kwargs, measure=False):
+    """Calls the function on the track in a worker, returning its result,
+    the error (if any), the time spent on it, and the size of the pickled
+    result (if `measure`)."""
+    start = time.time()
+    try:
+        result, error = func(file_struct, *args, **kwargs), None
+    except Exception:
+        result, error = None, traceback.format_exc()
+    busy = time.time() - start
+    result_bytes = _pickled_size((result, error, busy)) if measure else 0
+    return result, error, busy, result_bytes
+
+
+def map_tracks(func, file_structs, args=(), kwargs=None, n_jobs=4,
+               stats=None):
+    """Applies `func(file_struct, *args, **kwargs)` to every track, yielding
+    the results as the tracks finish.
+
+    The tracks are dispatched longest-first (see `schedule_tracks`) to a
+    pool of `n_jobs` processes. An exception in a track is returned as its
+    error, so the rest of the tracks are still processed.
+
+    Each task sends the function, the FileStruct and the arguments to a
+    worker, so the arguments should be lightweight descriptors (paths and
+    parameters): large data should be loaded by the workers themselves, or
+    memory-mapped before starting them so that they share it.
+
+    Parameters
+    ----------
+    func: function
+        Module-level function to apply (it must be picklable).
+    file_structs: list
+        FileStructs of the tracks.
+    args: tuple
+        Additional positional arguments of the function.
+    kwargs: dict
+        Additional keyword arguments of the function.
+    n_jobs: int
+        Number of processes (see `get_n_jobs`).
+    stats: dict
+        If given, it is filled with the number of processes (`n_jobs`), the
+        time spent in the function summed over the tracks (`busy`), and the
+        achieved core utilization (`utilization`, i.e., `busy` divided by
+        `n_jobs` times the elapsed time), updated as the tracks finish.
+        With multiple processes, it also contains the bytes pickled to the
+        workers (`ipc_bytes_sent`) and back (`ipc_bytes_received`), and
+        their mean per task (`ipc_bytes_per_task`).
+
+    Yields
+    ------
+    file_struct: `msaf.io.FileStruct`
+        FileStruct of the finished track.
+    result: object
+        Value returned by the function (`None` if it failed).
+    error: str
+        Traceback of the error, or `None` if the track succeeded.
+    """
+    kwargs = {} if kwargs is None else kwargs
+    n_jobs = min(get_n_jobs(n_jobs), max(len(file_structs), 1))
+    if stats is None:
+        stats = {}
+    stats.update(n_jobs=n_jobs, busy=0.0, utilization=0.0, ipc_bytes_sent=0,
+                 ipc_bytes_received=0, ipc_bytes_per_task=0.0)
+    start = time.time()
+    n_finished = [0]
+
+    def update_stats(busy, sent=0, received=0):
+        n_finished[0] += 1
+        stats["busy"] += busy
+        stats["ipc_bytes_sent"] += sent
+        stats["ipc_bytes_received"] += received
+        stats["ipc_bytes_per_task"] = float(
+            stats["ipc_bytes_sent"] + stats["ipc_bytes_received"]) / \
+            n_finished[0]
+        elapsed = time.time() - start
+        if elapsed > 0:
+            stats["utilization"] = stats["busy"] / (n_jobs * elapsed)
+
+    if n_jobs == 1:
+        for file_struct in file_structs:
+            result, error, busy, _ = _call_track(func, file_struct, args,
+                                                 kwargs)
+            update_stats(busy)
+            yield file_struct, result, error
+        return
+
+    # The arguments are the same for all the tasks
+    args_bytes = _pickled_size((func, args, kwargs, True))
+
+    executor = ProcessPoolExecutor(max_workers=n_jobs)
+    futures = {}
+    try:
+        # Submitted in order, so the free workers take the longest tracks
+        for file_struct in schedule_tracks(file_structs):
+            futures[executor.submit(_call_track, func, file_struct, args,
+                                    kwargs, True)] = file_struct
+        for future in as_completed(futures):
+            file_struct = futures[future]
+            try:
+                result, error, busy, result_bytes = future.result()
+            except Exception:
+                # The worker died or the result could not be sent back
+                result, error, busy = None, traceback.format_exc(), 0.0
+                result_bytes = 0
+            update_stats(busy, args_bytes + _pickled_size(file_struct),
+                         result_bytes)
+            yield file_struct, result, error
+    finally:
+        # If the consumer stops early, do not run the pending tracks
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+    logging.info("Core utilization: %.1f%% of %d processes, %.1f KB of IPC "
+                 "per task" % (100 * stats["utilization"], n_jobs,
+                               stats["ipc_bytes_per_task"] / 1024.))
@@ -0,0 +1,510 @@
+"""
+Long-lived segmentation service.
+
+The service keeps a pool of warm worker processes, with the algorithms
+imported and their models (e.g., the OLDA transforms) loaded, and answers
+segmentation requests over HTTP on localhost. The requests are queued and
+sent to the workers in batches: while all the workers are busy, the new
+requests accumulate in the queue and are dispatched together to the next
+free worker.
+
+Endpoints
+---------
+POST /segment
+    Segments a track. The JSON body contains either the `path` of a
+    pianoroll `.npz` file, or the raw `pianorolls` (one `(n_time_steps,
+    128)` array per instrument) with their `tempo` and `beat_resolution`
+    (and optionally their `programs` and `is_drums`). The algorithms and
+    their parameters can be given as in `msaf.run.process_grid`
+    ("boundaries_id", "labels_id", "feature", "hier", "config"...), and
+    default to the ones of the service. Returns the estimated `boundaries`
+    (times in seconds) and `labels`, or the `error`.
+GET /metrics
+    Queue depth, number of requests, errors and batches, and latencies.
+GET /health
+    Returns `{"status": "ok"}` while the service is up.
+
+Examples
+--------
+Start the service with 4 workers, using olda and scluster by default::
+
+    python -m msaf.service -j 4 -b olda -l scluster -f mfcc
+
+Segment a track from Python::
+
+    from msaf import service
+    times, labels = service.request_segmentation("track.npz")
+"""
+import argparse
+import collections
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import json
+import logging
+import os
+import queue
+import socketserver
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import numpy as np
+
+import msaf
+from msaf import input_output as io
+from msaf import run
+from msaf import scheduler
+from msaf.exceptions import SegmentationServiceError
+from msaf.features import Features
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+def _init_worker(combinations):
+    """Preloads the algorithms in a worker (already done if the worker was
+    forked from the service)."""
+    for boundaries_id, labels_id, config in \
+            run.get_grid_configurations(combinations):
+        run.preload_algorithms(boundaries_id, labels_id, config)
+
+
+def _get_pid(_):
+    return os.getpid()
+
+
+def make_file_struct(request):
+    """Creates the in-memory file structure of a request.
+
+    If the request contains the raw pianorolls, their multitrack is put in
+    the features store of the file structure, so the features are computed
+    from it without reading any file.
+    """
+    if "pianorolls" not in request:
+        return io.FileStruct(request["path"], in_memory=True)
+
+    import pypianoroll
+    n_tracks = len(request["pianorolls"])
+    programs = request.get("programs") or [0] * n_tracks
+    is_drums = request.get("is_drums") or [False] * n_tracks
+    tracks = [pypianoroll.Track(pianoroll=np.asarray(pianoroll),
+                                program=program, is_drum=is_drum)
+              for pianoroll, program, is_drum in
+              zip(request["pianorolls"], programs, is_drums)]
+    file_struct = io.FileStruct(request.get("name", "request.npz"),
+                                in_memory=True)
+    file_struct.features_store["multitrack"] = pypianoroll.Multitrack(
+        tracks=tracks, tempo=float(request["tempo"]),
+        beat_resolution=int(request["beat_resolution"]))
+    return file_struct
+
+
+def _to_list(values):
+    """Converts the (flat or hierarchical) estimations to JSON lists."""
+    if isinstance(values, list):
+        return [_to_list(level) for level in values]
+    return np.asarray(values).tolist()
+
+
+def segment_batch(requests):
+    """Segments a batch of requests in a worker.
+
+    The requests on the same pianoroll file share its features, and the
+    boundaries that do not depend on their labels algorithm.
+
+    Returns
+    -------
+    responses: list
+        For each request, a dictionary with the estimated "boundaries" and
+        "labels", or the "error".
+    """
+    file_structs = {}
+    intermediates = {}
+    responses = []
+    for request in requests:
+        try:
+            path = request.get("path") if "pianorolls" not in request \
+                else None
+            if path is None:
+                file_struct = make_file_struct(request)
+            elif path not in file_structs:
+                file_struct = file_structs[path] = make_file_struct(request)
+                intermediates[path] = {}
+            else:
+                file_struct = file_structs[path]
+
+            boundaries_id, labels_id, config = \
+                run.get_grid_configurations([request])[0]
+            np.random.seed(123)
+            config["features"] = Features.select_features(
+                config["feature"], file_struct, config["annot_beats"],
+                config["framesync"])
+            est_times, est_labels = run.run_algorithms(
+                file_struct, boundaries_id, labels_id, config,
+                intermediates=intermediates.get(path))
+            responses.append({"boundaries": _to_list(est_times),
+                              "labels": _to_list(est_labels)})
+        except Exception:
+            responses.append({"error": traceback.format_exc()})
+    return responses
+
+
+class SegmentationService(object):
+    """Pool of warm segmentation workers fed by a local request queue."""
+    def __init__(self, n_jobs=4, boundaries_id=msaf.config.default_bound_id,
+                 labels_id=msaf.config.default_label_id, feature="pcp",
+                 preload=None, batch_size=8, batch_timeout=0.005,
+                 request_timeout=600, latency_window=1000):
+        """
+        Parameters
+        ----------
+        n_jobs: int
+            Number of worker processes (see `msaf.scheduler.get_n_jobs`).
+        boundaries_id: str
+            Default boundaries algorithm of the requests.
+        labels_id: str
+            Default labels algorithm of the requests.
+        feature: str
+            Default features of the requests.
+        preload: list
+            Additional combinations of algorithms to preload in the workers,
+            as in `msaf.run.process_grid` (the default one is preloaded).
+        batch_size: int
+            Maximum number of requests sent to a worker at once.
+        batch_timeout: float
+            Time (in seconds) to wait for more requests before sending a
+            batch that is not full.
+        request_timeout: float
+            Maximum time (in seconds) that an HTTP request waits for its
+            response.
+        latency_window: int
+            Number of latest requests used for the latency metrics.
+        """
+        self.n_jobs = scheduler.get_n_jobs(n_jobs)
+        self.defaults = {"boundaries_id": boundaries_id,
+                         "labels_id": labels_id, "feature": feature}
+        self.combinations = [self.defaults] + list(preload or [])
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.request_timeout = request_timeout
+
+        self._queue = queue.Queue()
+        self._slots = threading.Semaphore(self.n_jobs)
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=latency_window)
+        self._executor = None
+        self._dispatcher = None
+        self._broken = False
+        self._in_flight = 0
+        self.n_requests = 0
+        self.n_errors = 0
+        self.n_batches = 0
+        self.n_batched = 0
+        self.n_restarts = 0
+
+    def _start_workers(self):
+        """Creates the pool of workers, with the algorithms preloaded."""
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.n_jobs, initializer=_init_worker,
+            initargs=(self.combinations,))
+        # Start all the workers now, so the first requests are not slower
+        pids = set(self._executor.map(_get_pid, range(4 * self.n_jobs)))
+        logging.info("Started %d workers" % len(pids))
+
+    def _restart_workers(self):
+        """Replaces a broken pool (e.g., after a worker crashed)."""
+        logging.warning("A worker died, restarting the workers")
+        self._executor.shutdown(wait=False)
+        self._broken = False
+        self.n_restarts += 1
+        self._start_workers()
+
+    def start(self):
+        """Loads the algorithms and starts the workers."""
+        _init_worker(self.combinations)
+        self._start_workers()
+        self._dispatcher = threading.Thread(target=self._dispatch)
+        self._dispatcher.daemon = True
+        self._dispatcher.start()
+
+    def stop(self):
+        """Waits for the queued requests and stops the workers."""
+        self._queue.put(None)
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+
+    def submit(self, request):
+        """Queues a segmentation request (see the module documentation).
+
+        Returns
+        -------
+        future: `concurrent.futures.Future`
+            Future of the response.
+        """
+        request = dict(self.defaults, **request)
+        if "pianorolls" in request:
+            # Arrays are smaller than nested lists to send to the workers
+            request["pianorolls"] = [np.asarray(pianoroll)
+                                     for pianoroll in request["pianorolls"]]
+        future = Future()
+        self._queue.put((request, future, time.time()))
+        return future
+
+    def segment(self, request, timeout=None):
+        """Segments a request, waiting for the response."""
+        return self.submit(request).result(timeout)
+
+    def _dispatch(self):
+        """Sends the queued requests in batches to the free workers."""
+        stopping = False
+        while not stopping:
+            # Wait for a free worker, so the requests accumulate meanwhile
+            self._slots.acquire()
+            item = self._queue.get()
+            if item is None:
+                self._slots.release()
+                break
+            batch = [item]
+            deadline = time.time() + self.batch_timeout
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(
+                        timeout=max(deadline - time.time(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            with self._lock:
+                self._in_flight += len(batch)
+                self.n_batches += 1
+                self.n_batched += len(batch)
+            try:
+                if self._broken:
+                    self._restart_workers()
+                future = self._executor.submit(
+                    segment_batch, [request for request, _, _ in batch])
+            except Exception:
+                # Fail this batch, and try again with new workers for the
+                # next one
+                self._broken = True
+                self._respond(batch, [{"error": traceback.format_exc()}] *
+                              len(batch))
+                continue
+            future.add_done_callback(
+                lambda future, batch=batch: self._complete(batch, future))
+
+    def _complete(self, batch, future):
+        """Sends the responses of a finished batch to their requests."""
+        try:
+            responses = future.result()
+        except Exception as e:
+            # The worker died or the responses could not be sent back
+            if isinstance(e, BrokenProcessPool):
+                self._broken = True
+            responses = [{"error": traceback.format_exc()}] * len(batch)
+        self._respond(batch, responses)
+
+    def _respond(self, batch, responses):
+        """Sends the responses to the requests of a batch, and frees its
+        worker slot."""
+        now = time.time()
+        with self._lock:
+            for (_, _, start), response in zip(batch, responses):
+                self._latencies.append(now - start)
+                self.n_requests += 1
+                self.n_errors += "error" in response
+            self._in_flight -= len(batch)
+        self._slots.release()
+        for (_, request_future, _), response in zip(batch, responses):
+            request_future.set_result(response)
+
+    def metrics(self):
+        """Returns the current metrics of the service: number of queued and
+        running requests, number of requests, errors and batches, and the
+        mean, median, 95th percentile and maximum latency (in seconds) of
+        the latest requests."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            metrics = {
+                "queue_depth": self._queue.qsize(),
+                "in_flight": self._in_flight,
+                "n_workers": self.n_jobs,
+                "n_requests": self.n_requests,
+                "n_errors": self.n_errors,
+                "n_batches": self.n_batches,
+                "n_restarts": self.n_restarts,
+                "mean_batch_size": float(self.n_batched) /
+                max(self.n_batches, 1)
+            }
+        if latencies:
+            metrics.update(
+                latency_mean=float(np.mean(latencies)),
+                latency_p50=latencies[len(latencies) // 2],
+                latency_p95=latencies[min(int(0.95 * len(latencies)),
+                                          len(latencies) - 1)],
+                latency_max=latencies[-1])
+        return metrics
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """HTTP interface of the service (see the module documentation)."""
+    def _send_json(self, code, obj):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send_json(200, self.server.service.metrics())
+        elif self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": "Unknown path %s" % self.path})
+
+    def do_POST(self):
+        if self.path != "/segment":
+            self._send_json(404, {"error": "Unknown path %s" % self.path})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+        except ValueError:
+            self._send_json(400, {"error": "The request is not valid JSON"})
+            return
+        if not isinstance(request, dict) or \
+                ("path" not in request and "pianorolls" not in request):
+            self._send_json(400, {"error": "The request must contain the "
+                                  "path or the pianorolls of the track"})
+            return
+        service = self.server.service
+        try:
+            response = service.segment(request,
+                                       timeout=service.request_timeout)
+        except FutureTimeoutError:
+            self._send_json(504, {"error": "No response after %g seconds" %
+                                  service.request_timeout})
+            return
+        self._send_json(500 if "error" in response else 200, response)
+
+    def log_message(self, format, *args):
+        logging.debug("%s - %s" % (self.address_string(), format % args))
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Starts the service and answers its HTTP requests until interrupted.
+
+    Parameters
+    ----------
+    service: `SegmentationService`
+        The (not started) service.
+    host: str
+        Host to listen to (localhost by default).
+    port: int
+        Port to listen to.
+    """
+    service.start()
+    server = _ThreadingHTTPServer((host, port), _RequestHandler)
+    server.service = service
+    logging.info("Segmentation service listening on http://%s:%d" %
+                 (host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+
+
+def request_segmentation(path=None, url="http://%s:%d" % (DEFAULT_HOST,
+                                                          DEFAULT_PORT),
+                         timeout=None, **params):
+    """Segments a track with a running segmentation service.
+
+    Parameters
+    ----------
+    path: str
+        Path to the pianoroll `.npz` file (`None` if the raw `pianorolls`
+        are given in `params`).
+    url: str
+        URL of the service.
+    timeout: float
+        Maximum time (in seconds) to wait for the response.
+    params: dict
+        Additional parameters of the request (see the module
+        documentation).
+
+    Returns
+    -------
+    est_times: list
+        Estimated times for the segment boundaries (a list per level if
+        hierarchical).
+    est_labels: list
+        Estimated labels of the segments (a list per level if
+        hierarchical).
+    """
+    request = dict(params)
+    if path is not None:
+        request["path"] = os.path.abspath(path)
+    if "pianorolls" in request:
+        request["pianorolls"] = [np.asarray(pianoroll).tolist()
+                                 for pianoroll in request["pianorolls"]]
+    data = json.dumps(request).encode("utf-8")
+    http_request = Request(url + "/segment", data=data,
+                           headers={"Content-Type": "application/json"})
+    try:
+        with urlopen(http_request, timeout=timeout) as f:
+            response = json.loads(f.read().decode("utf-8"))
+    except HTTPError as e:
+        response = json.loads(e.read().decode("utf-8"))
+        raise SegmentationServiceError(response.get("error", str(e)))
+    return response["boundaries"], response["labels"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Runs the MSAF segmentation service on localhost.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help="Host to listen to.")
+    parser.add_argument("-p", "--port", type=int, default=DEFAULT_PORT,
+                        help="Port to listen to.")
+    parser.add_argument("-j", "--n_jobs", type=int, default=4,
+                        help="Number of worker processes.")
+    parser.add_argument("-b", "--boundaries_id",
+                        default=msaf.config.default_bound_id,
+                        help="Default boundaries algorithm.")
+    parser.add_argument("-l", "--labels_id",
+                        default=msaf.config.default_label_id,
+                        help="Default labels algorithm.")
+    parser.add_argument("-f", "--feature", default="pcp",
+                        help="Default features.")
+    parser.add_argument("--batch_size", type=int, default=8,
+                        help="Maximum number of requests per batch.")
+    parser.add_argument("--batch_timeout", type=float, default=0.005,
+                        help="Seconds to wait to fill a batch.")
+    parser.add_argument("--request_timeout", type=float, default=600,
+                        help="Seconds that a request waits for its response.")
+    args = parser.parse_args()
+    logging.basicConfig(format='%(asctime)s: %(levelname)s: %(message)s',
+                        level=logging.INFO)
+    serve(SegmentationService(
+        n_jobs=args.n_jobs, boundaries_id=args.boundaries_id,
+        labels_id=args.labels_id, feature=args.feature,
+        batch_size=args.batch_size, batch_timeout=args.batch_timeout,
+        request_timeout=args.request_timeout),
+        host=args.host, port=args.port)
@@ -2,7 +2,6 @@
 Useful functions that are common in MSAF
 """
 import librosa
-import mir_eval
 import numpy as np
 import os
 import scipy.io.wavfile
@@ -141,6 +140,7 @@ def sonify_clicks(audio, clicks, out_file, fs, offset=0):
     # Exponential decay
     click *= np.exp(-np.arange(fs * .1) / (fs * .01))
     length = int(times.max() * fs + click.shape[0] + 1)
+    import mir_eval.sonify
     audio_clicks = mir_eval.sonify.clicks(times, fs, length=length)
 
     # Create array to store the audio plus the clicks